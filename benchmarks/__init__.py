@@ -0,0 +1,5 @@
+"""Offline benchmarks for rout3r
+
+fakerouter serves the pages of the supported router models from a local HTTP server, and bench measures
+rout3r against it. Run from the repository root with python -m benchmarks.bench (or benchmarks.fakerouter to
+serve a fake router by itself)."""
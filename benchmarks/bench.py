@@ -0,0 +1,146 @@
+"""Benchmarks for rout3r against local fake routers
+
+Reports automatic discovery time, the latency percentiles of each router call, client list parse throughput
+by client count and fleet supervisor check throughput. Use --json to save the results and compare runs."""
+__author__ = "ex0dus"
+__version__ = "1.0"
+
+import argparse, json, sys, time, rout3r, rout3r.actiontec, rout3r.asus, rout3r.fleet, rout3r.polling
+from benchmarks import fakerouter
+
+ROUTER_CLASSES = {"C1000A": rout3r.actiontec.C1000A, "RTAC68U": rout3r.asus.RTAC68U}
+PARSERS = {
+
+    "C1000A": (fakerouter.c1000a_clients, rout3r.actiontec._parse_clients),
+    "RTAC68U": (fakerouter.rtac68u_clients, rout3r.asus._parse_clients)
+
+}
+CALLS = ("is_online", "get_firmware", "get_clients", "get_status")
+CLIENT_COUNTS = (10, 100, 1000, 10000)
+PERCENTILES = (50, 90, 99)
+
+def percentiles(samples, points=PERCENTILES):
+    """Return a dict of the given percentiles (nearest rank) of the samples, in milliseconds"""
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    return {"p{0}".format(point): round(samples[min(len(samples) - 1, len(samples) * point // 100)] * 1000, 3)
+            for point in points}
+
+def _timed(function, runs):
+    samples = []
+    errors = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        try:
+            function()
+        except Exception:
+            errors += 1
+            continue
+        samples.append(time.perf_counter() - start)
+    return samples, errors
+
+def bench_discovery(router, runs):
+    """Time rout3r.get_router against the fake router, without the fallback IPs"""
+    samples, errors = _timed(lambda: rout3r.get_router(router.address, False), runs)
+    return dict(percentiles(samples), errors=errors)
+
+def bench_calls(router, runs):
+    """Time each router call with the page cache disabled so every call reaches the fake router"""
+    instance = ROUTER_CLASSES[router.model]("admin", "password", router.address, page_ttl=0)
+    try:
+        results = {}
+        for call in CALLS:
+            samples, errors = _timed(getattr(instance, call), runs)
+            results[call] = dict(percentiles(samples), errors=errors)
+        return results
+    finally:
+        instance.logout()
+
+def bench_parse(model, counts=CLIENT_COUNTS, min_time=0.2):
+    """Measure how many clients per second the model's client list parser handles at each client count"""
+    generate, parse = PARSERS[model]
+    results = {}
+    for count in counts:
+        data = generate(count)
+        runs = 0
+        start = time.perf_counter()
+        while True:
+            parse(data)
+            runs += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        results[count] = {"ms": round(elapsed / runs * 1000, 3), "clients_per_s": round(count * runs / elapsed)}
+    return results
+
+def bench_fleet(router, gateways, duration, workers=rout3r.fleet.WORKERS):
+    """Run a supervisor over many gateways (all served by the fake router) as fast as its policy allows and
+    count the checks made"""
+    policy = rout3r.polling.PollPolicy(stable_interval=0, failure_interval=0, reboot_interval=duration,
+                                       reboot_max_interval=duration)
+    fleet = [rout3r.fleet.Gateway(router.address, "admin", "password", ROUTER_CLASSES[router.model],
+                                  "gateway-{0}".format(i)) for i in range(gateways)]
+    supervisor = rout3r.fleet.Supervisor(fleet, workers=workers, policy=policy, jitter=0)
+    supervisor.start()
+    time.sleep(duration)
+    supervisor.stop()
+    checks = sum(watch.checks for watch in supervisor.watches)
+    return {"gateways": gateways, "workers": workers, "checks": checks, "checks_per_s": round(checks / duration, 1)}
+
+def run(args):
+    results = {"version": rout3r.__version__, "config": vars(args), "models": {}}
+    for model in args.models:
+        with fakerouter.FakeRouter(model, args.clients, args.latency, args.jitter, args.failure_rate,
+                                   args.failure_mode) as router:
+            results["models"][model] = {
+
+                "discovery": bench_discovery(router, args.runs),
+                "calls": bench_calls(router, args.runs),
+                "parse": bench_parse(model, args.parse_counts),
+                "fleet": bench_fleet(router, args.gateways, args.duration, args.workers),
+                "requests": dict(router.counts)
+
+            }
+    return results
+
+def report(results, out=sys.stdout):
+    for model, result in results["models"].items():
+        out.write("{0}\n".format(model))
+        out.write("  discovery           {0}\n".format(_format(result["discovery"])))
+        for call, latency in result["calls"].items():
+            out.write("  {0:<19} {1}\n".format(call, _format(latency)))
+        for count, parse in result["parse"].items():
+            out.write("  parse {0:>6} clients {1:>10.3f} ms  {2:>10} clients/s\n".format(
+                count, parse["ms"], parse["clients_per_s"]))
+        fleet = result["fleet"]
+        out.write("  fleet {0} gateways / {1} workers  {2} checks/s\n".format(
+            fleet["gateways"], fleet["workers"], fleet["checks_per_s"]))
+
+def _format(latency):
+    return "  ".join("{0} {1:>8.3f} ms".format(key, value) for key, value in latency.items() if key != "errors") + \
+           ("  errors {0}".format(latency["errors"]) if latency["errors"] else "")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rout3r against local fake routers")
+    parser.add_argument("--models", nargs="+", choices=fakerouter.MODELS, default=list(fakerouter.MODELS))
+    parser.add_argument("--runs", type=int, default=50, help="calls timed per measurement")
+    parser.add_argument("--clients", type=int, default=20, help="clients served by the fake routers")
+    parser.add_argument("--parse-counts", type=int, nargs="+", default=list(CLIENT_COUNTS))
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--jitter", type=float, default=0.002)
+    parser.add_argument("--failure-rate", type=float, default=0)
+    parser.add_argument("--failure-mode", choices=fakerouter.FAILURE_MODES, default="status")
+    parser.add_argument("--gateways", type=int, default=50, help="gateways watched by the fleet benchmark")
+    parser.add_argument("--workers", type=int, default=rout3r.fleet.WORKERS)
+    parser.add_argument("--duration", type=float, default=3, help="seconds the fleet benchmark runs")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    results = run(args)
+    report(results)
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=1)
+
+if __name__ == "__main__":
+    main()
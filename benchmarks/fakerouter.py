@@ -0,0 +1,232 @@
+"""A local stand-in for router web interfaces
+
+FakeRouter serves the pages rout3r reads from a C1000A or RT-AC68U with a generated client list, and can add
+latency (with jitter) to every response and fail a fraction of requests, either with a 503 or by dropping the
+connection. With a boot_time, a reboot request takes the router down (closing every connection) for that many
+seconds. The page contents follow the formats the router modules parse, not the real routers' full pages."""
+__author__ = "ex0dus"
+__version__ = "1.0"
+
+import argparse, http.server, json, random, socket, threading, time
+
+MODELS = ("C1000A", "RTAC68U")
+FAILURE_MODES = ("status", "drop")
+REBOOT_PATHS = {"C1000A": "/rebootinfo.cgi", "RTAC68U": "/apply.cgi"}
+
+def _mac(index):
+    return "02:00:{0:02x}:{1:02x}:{2:02x}:{3:02x}".format(*index.to_bytes(4, "big"))
+
+def _ip(index):
+    return "10.{0}.{1}.{2}".format((index >> 16) & 255, (index >> 8) & 255, index & 255 or 1)
+
+def c1000a_clients(count):
+    """The modemstatus_activeuserlist_refresh.html body of a C1000A with count clients"""
+    return "".join("{ip} (&#40;host-{i}&#41;) /lan/{mac}/{type}/|".format(
+        ip=_ip(i), i=i, mac=_mac(i), type="802.11" if i % 3 else "Ethernet") for i in range(count)).encode()
+
+def rtac68u_clients(count):
+    """The update_clients.asp body of an RT-AC68U with count clients"""
+    clients = {"maclist": [_mac(i).upper() for i in range(count)]}
+    for i in range(count):
+        clients[_mac(i).upper()] = {
+
+            "name": "host-{0}".format(i), "nickName": "", "ip": _ip(i), "isOnline": 1, "vendor": "",
+            "ipMethod": "DHCP", "internetMode": "allow", "rssi": str(-30 - i % 60), "isWL": str(i % 3)
+
+        }
+    return "originData = {{ fromNetworkmapd : {0},\nnmpClient : [] }}".format(json.dumps([clients])).encode()
+
+def c1000a_pages(clients, online=True):
+    status = "Connected" if online else "Not Connected"
+    return {
+
+        "/": b"<html><title>Actiontec C1000A</title><script>var board_id='C1000A'; "
+             b"var sessionKey = '1234567890';</script></html>",
+        "/login.html": b"<html>ok</html>",
+        "/modemstatus_home.html": "var soft_ver='CAC003-31.30L.86'; var phy_status='{0}'; var ISP_status='{0}';"
+                                  .format(status).encode(),
+        "/modemstatus_activeuserlist_refresh.html": c1000a_clients(clients),
+        "/wirelesssetup_basicsettings.html": b'gv_ssid = "FakeNet"; gv_wpapsk_key  = "fakekey";'
+
+    }
+
+def rtac68u_pages(clients, online=True):
+    return {
+
+        "/": b"<script>top.location.href='/Main_Login.asp';</script>",
+        "/Main_Login.asp": b"<html><title>ASUS Wireless Router RT-AC68U - Login</title></html>",
+        "/index.asp": "<input type=\"hidden\" name=\"firmver\" value=\"3.0.0.4\">"
+                      "function wanlink_statusstr() {{ return '{0}'; }}"
+                      .format("Connected" if online else "Disconnected").encode(),
+        "/update_clients.asp": rtac68u_clients(clients),
+        "/ajax_status.xml": b"<devicemap><wan>1</wan><sys>uptime=Thu, 01 Jan 1970 (86400 secs since boot)</sys>"
+                            b"</devicemap>",
+        "/Advanced_Wireless_Content.asp": b'<input name="wl_ssid_org" value="FakeNet">'
+                                          b'<input name="wl_wpa_psk_org" value="fakekey">'
+
+    }
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    router = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.router._connect(self.connection)
+
+    def finish(self):
+        try:
+            super().finish()
+        finally:
+            self.router._disconnect(self.connection)
+
+    def _respond(self):
+        router = self.router
+        path = self.path.split("?", 1)[0]
+        router._count(path)
+        delay = router.latency + random.uniform(-router.jitter, router.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if router.failure_rate and random.random() < router.failure_rate:
+            router._count("failures")
+            if router.failure_mode == "drop":
+                self.close_connection = True
+                return
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = router.pages.get(path, b"")
+        self.send_response(200)
+        if path == "/login.cgi" and router.model == "RTAC68U":
+            self.send_header("Set-Cookie", "asus_token=fake; Path=/")
+        self.send_header("Content-Type", "text/xml" if path.endswith(".xml") else "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if path == REBOOT_PATHS[router.model] and router.boot_time:
+            self.wfile.flush()
+            threading.Thread(target=router.reboot, daemon=True).start()
+
+    def do_GET(self):
+        self._respond()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self._respond()
+
+class FakeRouter:
+    """A fake router of the given model (one of MODELS) served on host:port (port 0 picks a free port)
+
+    latency and jitter are in seconds, failure_rate is the fraction of requests which fail in failure_mode
+    ("status" answers 503, "drop" closes the connection without an answer)"""
+
+    def __init__(self, model="C1000A", clients=10, latency=0, jitter=0, failure_rate=0, failure_mode="status",
+                 online=True, host="127.0.0.1", port=0, boot_time=0):
+        if model not in MODELS:
+            raise ValueError("Unknown model {0}, expected one of {1}".format(model, ", ".join(MODELS)))
+        if failure_mode not in FAILURE_MODES:
+            raise ValueError("Unknown failure mode {0}".format(failure_mode))
+        self.model = model
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_mode = failure_mode
+        self.boot_time = boot_time
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._connections = set()
+        self.set_clients(clients, online)
+        self._handler = type("Handler", (_Handler,), {"router": self})
+        self._server = self._bind(host, port)
+        self._thread = None
+
+    @property
+    def address(self):
+        """The "host:port" to give rout3r as the router's IP address"""
+        host, port = self._server.server_address[:2]
+        return "{0}:{1}".format(host, port)
+
+    def set_clients(self, clients, online=True):
+        """Regenerate the pages with a new client count and WAN state"""
+        self.clients = clients
+        self.online = online
+        self.pages = (c1000a_pages if self.model == "C1000A" else rtac68u_pages)(clients, online)
+
+    def _bind(self, host, port):
+        server = http.server.ThreadingHTTPServer((host, port), self._handler)
+        server.daemon_threads = True
+        return server
+
+    def _connect(self, connection):
+        with self._lock:
+            self._connections.add(connection)
+
+    def _disconnect(self, connection):
+        with self._lock:
+            self._connections.discard(connection)
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fakerouter", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close every open connection, like a router going down"""
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def reboot(self, boot_time=None):
+        """Go down for boot_time seconds (the router's boot_time by default), then serve again on the same port"""
+        host, port = self._server.server_address[:2]
+        self.stop()
+        self._count("reboots")
+        time.sleep(self.boot_time if boot_time is None else boot_time)
+        self._server = self._bind(host, port)
+        self.start()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake router for rout3r")
+    parser.add_argument("--model", choices=MODELS, default="C1000A")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0, help="seconds the latency varies by")
+    parser.add_argument("--failure-rate", type=float, default=0, help="fraction of requests which fail")
+    parser.add_argument("--failure-mode", choices=FAILURE_MODES, default="status")
+    parser.add_argument("--offline", action="store_true", help="report the WAN as down")
+    parser.add_argument("--boot-time", type=float, default=0, help="seconds a reboot request takes it down for")
+    args = parser.parse_args()
+    router = FakeRouter(args.model, args.clients, args.latency, args.jitter, args.failure_rate, args.failure_mode,
+                        not args.offline, args.host, args.port, args.boot_time).start()
+    print("Serving a fake {0} on {1}".format(router.model, router.address))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        router.stop()
+
+if __name__ == "__main__":
+    main()
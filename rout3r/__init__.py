@@ -6,12 +6,29 @@ may pose a security risk that can be avoided by disabling them"""
 __author__ = "ex0dus"
 __version__ = "1.0"
 
-from requests.exceptions import ConnectionError
-import abc, pkgutil, os, importlib, requests
+import abc, os, json, importlib, functools, threading
+from rout3r.fingerprint import Signature, SignatureRegistry
+from rout3r import metrics
 
-NON_ROUTER_MODULES = ["__init__"]
-ROUTER_MODULES = [name for _, name, _ in pkgutil.iter_modules([os.path.dirname(__file__)])
-                  if name not in NON_ROUTER_MODULES]
+NON_ROUTER_MODULES = ["__init__", "aio", "batch", "cache", "clients", "fingerprint", "fleet", "history", "manifest",
+                      "metrics", "pagecache", "polling", "scanner", "sessions", "transport", "workers"]
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), "manifest.json")
+"""The generated list of router modules, classes and signatures (see rout3r.manifest)"""
+
+def _scan_modules():
+    import pkgutil
+    return [name for _, name, _ in pkgutil.iter_modules([os.path.dirname(__file__)])
+            if name not in NON_ROUTER_MODULES]
+
+def _read_manifest():
+    try:
+        with open(MANIFEST_PATH) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+
+_manifest = _read_manifest()
+ROUTER_MODULES = list(_manifest["modules"]) if _manifest is not None else _scan_modules()
 __all__ = ROUTER_MODULES
 
 DEFAULT_IP = "192.168.1.1"
@@ -23,51 +40,231 @@ FALLBACK_DEFAULT_IPS = [
 
 ]
 """Note: using the fallback IPs may pose a security risk if the router is unreachable"""
+DISCOVERY_TIMEOUT = (2, 5)
+"""The (connect, read) timeout in seconds for each gateway probe"""
+DISCOVERY_BUDGET = 10
+"""The overall time in seconds that automatic discovery may take before giving up"""
+ENABLE_DISCOVERY_CACHE = False
+"""Remember discovered routers on disk (see rout3r.cache) so later runs can skip discovery"""
 
 def get_public_ip():
     """Retrieve your public IP address (using ipify)"""
+    import requests
     return requests.get('https://api.ipify.org').text
 
 class RouterLoggedOutException(Exception):
     pass
 
+class RouterNotReadyException(Exception):
+    """Raised by Router.wait_until_ready when the router is not ready in time, phase is the last boot phase it
+    reached (see rout3r.polling.BOOT_PHASES), or None"""
+
+    def __init__(self, message, phase=None):
+        super().__init__(message)
+        self.phase = phase
+
+def relogin(method):
+    """Decorator for router methods which logs back in and retries the call once when the session has expired,
+    unless the router was logged out with logout()"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        expired_state = self._session_state
+        try:
+            return method(self, *args, **kwargs)
+        except RouterLoggedOutException:
+            if not self.auto_relogin or self._logged_out:
+                raise
+        with self._login_lock:
+            if not self.logged_in or self._session_state is expired_state:
+                self.login()
+        return method(self, *args, **kwargs)
+    return wrapper
+
 class RouterResult:
     """A result object returned by automatic methods which find routers containing the
     router class and IP address"""
     Class = None
     ip_address = None
+    headers = None
 
-    def __init__(self, Class, ip_address):
+    def __init__(self, Class, ip_address, headers=None):
         self.Class = Class
         self.ip_address = ip_address
+        self.headers = headers
 
     def __call__(self, *args, **kwargs):
         return self.Class.__call__(ip_address=self.ip_address, *args, **kwargs)
 
 class RouterClient:
     """An object to describe characteristics about clients connected to the router"""
-    name = None
-    ip_address = None
-    mac_address = None
-    connection_type = None
-    radio_strength = None
-    is_online = True
+    __slots__ = ("name", "ip_address", "mac_address", "connection_type", "radio_strength", "is_online")
+
+    def __init__(self, name=None, ip_address=None, mac_address=None, connection_type=None, radio_strength=None,
+                 is_online=True):
+        self.name = name
+        self.ip_address = ip_address
+        self.mac_address = mac_address
+        self.connection_type = connection_type
+        self.radio_strength = radio_strength
+        self.is_online = is_online
+
+    def _fields(self):
+        return [name for Class in reversed(type(self).__mro__) for name in getattr(Class, "__slots__", ())]
 
     def __str__(self):
-        return str(self.__dict__)
+        return str({name: getattr(self, name) for name in self._fields()})
 
     def __repr__(self):
         return str(self)
 
+class RouterStatus:
+    """A snapshot of the router status returned by Router.get_status, values the router cannot report are None"""
+    __slots__ = ("online", "firmware", "ssid", "clients", "uptime")
+
+    def __init__(self, online=None, firmware=None, ssid=None, clients=None, uptime=None):
+        self.online = online
+        self.firmware = firmware
+        self.ssid = ssid
+        self.clients = clients
+        self.uptime = uptime
+
+    def __str__(self):
+        return str({name: getattr(self, name) for name in self.__slots__})
+
+    def __repr__(self):
+        return str(self)
+
+def _fetch_all(loaders):
+    """Call every loader in a dict at the same time and return a dict of their results"""
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(loaders)) as executor:
+        futures = {key: executor.submit(loader) for key, loader in loaders.items()}
+        return {key: future.result() for key, future in futures.items()}
+
+def _optional(getter):
+    def call():
+        try:
+            return getter()
+        except NotImplementedError:
+            return None
+    return call
+
 class Router(object, metaclass=abc.ABCMeta):
     """An abstract router class which all module router classes should extend"""
     manufacturer = None
     model = None
     firmware = None
+    auto_relogin = True
+    """Methods decorated with rout3r.relogin log back in once when the session expires"""
+    _session_store = None
+    _session_state = None
+    _logged_out = False
     
-    def __init__(self, username, password, ip_address=DEFAULT_IP):
+    """Router classes should send their requests through a session of the given rout3r.transport.Transport, or
+    the default one, and reuse pages read within page_ttl seconds through a rout3r.pagecache.PageCache. They
+    should call _open() to log in, which reuses a session saved in the rout3r.sessions.SessionStore if given"""
+    def __init__(self, username, password, ip_address=DEFAULT_IP, transport=None, page_ttl=None,
+                 session_store=None):
+        raise NotImplementedError("{0} is missing this implementation".format(self.__class__.__name__))
+
+    def _open(self, username, password, session_store=None):
+        self._username = username
+        self._password = password
+        self._session_store = session_store
+        self._login_lock = threading.RLock()
+        if not self._restore_session():
+            self.login()
+
+    """This method should log in with the stored credentials and set logged_in, it should not repeat checks which
+only matter the first time (relogin is True when logging back in)"""
+    def _login(self, relogin=False):
         raise NotImplementedError("{0} is missing this implementation".format(self.__class__.__name__))
 
+    """This method should return the session keys (besides cookies) to save in a session store"""
+    def _session_data(self):
+        return {}
+
+    """This method should restore the session keys returned by _session_data"""
+    def _load_session_data(self, data):
+        pass
+
+    def _restore_session(self):
+        """Use the saved session of the router if there is one newer than the current session"""
+        if self._session_store is None:
+            return False
+        state = self._session_store.load(self.ip_address, self._username)
+        if state is None or (self._session_state is not None and state["time"] <= self._session_state["time"]):
+            return False
+        self._session.cookies.update(state["cookies"])
+        self._load_session_data(state["data"])
+        self._session_state = state
+        self.logged_in = True
+        return True
+
+    """This method logs in to the router gateway, reusing a session another process saved if there is a newer one"""
+    def login(self):
+        with self._login_lock:
+            relogin = self._session_state is not None
+            self._logged_out = False
+            if self._session_store is None:
+                with metrics.timer(self.model, "login", metrics.LOGIN):
+                    self._login(relogin)
+                self._session_state = {}
+                return
+            with self._session_store.lock(self.ip_address, self._username):
+                if self._restore_session():
+                    return
+                with metrics.timer(self.model, "login", metrics.LOGIN):
+                    self._login(relogin)
+                self._session_store.save(self.ip_address, self._username, {
+
+                    "cookies": dict(self._session.cookies.items()),
+                    "data": self._session_data()
+
+                })
+                self._session_state = self._session_store.load(self.ip_address, self._username)
+
+    def _forget_session(self):
+        """Drop the session (and its saved copy) after the router rebooted, so the next login starts afresh"""
+        self._session.cookies.clear()
+        self._session_state = None
+        if self._session_store is not None:
+            self._session_store.delete(self.ip_address, self._username)
+
+    """This method waits until the router is usable, following it through each boot phase with progressive
+probing (see rout3r.polling.BootProbe) and returning as soon as it has logged in and, with wan, its WAN is
+connected. Pass down_first right after a reboot so a router which has not gone down yet is not taken as ready.
+Raises RouterNotReadyException if the router is not ready within timeout seconds"""
+    def wait_until_ready(self, timeout=None, wan=True, down_first=False, on_phase=None):
+        import time
+        from rout3r import polling
+        if timeout is None:
+            timeout = polling.READY_TIMEOUT
+
+        def login():
+            if not self.logged_in:
+                self._forget_session()
+                self.login()
+
+        probe = polling.BootProbe(self.ip_address, login, self.is_online, wan, down_first, on_phase=on_phase)
+        deadline = time.monotonic() + timeout
+        while True:
+            delay = probe.step()
+            if probe.ready:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RouterNotReadyException("The router at {0} is not ready after {1}s (reached: {2})".format(
+                    self.ip_address, timeout, probe.phase), probe.phase)
+            time.sleep(min(delay, remaining))
+
+    def _force_logout(self):
+        """Mark the session as expired after the router rejected it"""
+        metrics.increment(metrics.FORCED_LOGOUTS, self.model)
+        self.logged_in = False
+        self._pages.invalidate()
+        raise RouterLoggedOutException("This object is now logged out")
+
     """This method should check the status of the WAN connection in the router"""
     @abc.abstractmethod
     def is_online(self):
@@ -107,7 +304,56 @@ class Router(object, metaclass=abc.ABCMeta):
 NOTE: The module may still work even if unsupported!"""
     def supports_firmware(self):
         return self.firmware == self.get_firmware()
+
+    """This method returns a RouterStatus snapshot of the router. Router classes should override it to fetch each
+page once, in parallel, and parse them together; this fallback calls the individual getters in parallel"""
+    def get_status(self):
+        getters = {
+
+            "online": self.is_online,
+            "firmware": self.get_firmware,
+            "ssid": self.get_ssid,
+            "clients": getattr(self, "get_clients", None),
+            "uptime": getattr(self, "get_uptime", None)
+
+        }
+        return RouterStatus(**_fetch_all({name: _optional(getter) for name, getter in getters.items()
+                                          if getter is not None}))
+
+    """Router classes may return the raw pages get_status reads from this method and set _parse_status to the
+module-level function building the RouterStatus from them (_parse_status(pages, as_table=False), reading the
+clients into a ClientTable with as_table), which lets rout3r.workers parse them in another process"""
+    def _get_status_pages(self):
+        raise NotImplementedError("{0} is missing this implementation".format(self.__class__.__name__))
+
+    _parse_status = None
+
+    """Router classes may return the raw client list response from this method and parse it into a ClientTable
+with _parse_clients(data), which lets watch_clients skip parsing responses which have not changed"""
+    def _get_clients_raw(self):
+        raise NotImplementedError("{0} is missing this implementation".format(self.__class__.__name__))
+
+    def _parse_clients(self, data):
+        raise NotImplementedError("{0} is missing this implementation".format(self.__class__.__name__))
+
+    """This method polls the clients connected to the router every interval seconds and yields a
+rout3r.clients.ClientEvent for each client which joined, left or changed since the last poll"""
+    def watch_clients(self, interval=None, initial=True):
+        import time, rout3r.clients
+        if interval is None:
+            interval = rout3r.clients.WATCH_INTERVAL
+        feed = rout3r.clients.ClientFeed(self._parse_clients, initial)
+        while True:
+            try:
+                events = feed.update(self._get_clients_raw())
+            except NotImplementedError:
+                events = feed.update_table(self.get_clients(as_table=True))
+            yield from events
+            time.sleep(interval)
     
+    """Router classes may describe their model with a Signature, used by automatic discovery instead of check_model"""
+    signature = None
+
     """This method should return True when the gateway HTML matches this router model ONLY, otherwise return False"""
     @staticmethod
     @abc.abstractmethod
@@ -117,24 +363,125 @@ NOTE: The module may still work even if unsupported!"""
 __routers__ = [Router]
 """All rout3r modules require a list of their router classes"""
 
-def get_router(ip_address=DEFAULT_IP, test_fallbacks=ENABLE_FALLBACK_DEFAULT_IPS):
-    """Attempt to automatically get the router IP address and model, and optionally check fallback IPs"""
-    test_ips = [ip_address] + (FALLBACK_DEFAULT_IPS if test_fallbacks else [])
-    for ip in test_ips:
-        try:
-            result = requests.get("http://{0}/".format(ip))
+_registry = None
+_unsigned_routers = None
+
+def _import_router_module(router_module):
+    _import = importlib.import_module("{pack}.{module}".format(
+        pack=__package__,
+        module=router_module))
+    if not hasattr(_import, "__routers__"):
+        raise NotImplementedError("Module {0} is missing __routers__ list".format(_import))
+    return _import
+
+def _load_registry():
+    """Compile the signatures of every router class. With a manifest, only router modules containing classes
+    without a signature are imported, and the others are imported once their model is identified"""
+    global _registry, _unsigned_routers
+    if _registry is None:
+        registry = SignatureRegistry()
+        unsigned = []
+        if _manifest is not None:
+            for router_module, classes in _manifest["modules"].items():
+                for class_name, signature in classes.items():
+                    if signature is not None:
+                        registry.register((router_module, class_name), Signature.from_json(signature))
+                    else:
+                        unsigned.append(getattr(_import_router_module(router_module), class_name))
+        else:
             for router_module in ROUTER_MODULES:
-                _import = importlib.import_module("{pack}.{module}".format(
-                    pack=__package__,
-                    module=router_module))
-                if not hasattr(_import, "__routers__"):
-                    raise NotImplementedError("Module {0} is missing __routers__ list".format(_import))
-                for router_class in _import.__routers__:
-                    if router_class.check_model(result.text, ip):
-                        return RouterResult(router_class, ip)
-            raise NotImplementedError("The router at {ip} does not have a module, or cannot be determined automatically".format(
-                ip=ip))
-        except ConnectionError:
-            pass
+                for router_class in _import_router_module(router_module).__routers__:
+                    if router_class.signature is not None:
+                        registry.register(router_class, router_class.signature)
+                    else:
+                        unsigned.append(router_class)
+        _registry, _unsigned_routers = registry, unsigned
+    return _registry, _unsigned_routers
+
+def _resolve_router(key):
+    """Return the router class for a key of the signature registry"""
+    if isinstance(key, tuple):
+        router_module, class_name = key
+        return getattr(_import_router_module(router_module), class_name)
+    return key
+
+def _probe(ip, timeout=DISCOVERY_TIMEOUT):
+    """Fetch the gateway page at the IP address and return a RouterResult if a module recognizes it,
+    otherwise None"""
+    import requests
+    result = requests.get("http://{0}/".format(ip), timeout=timeout)
+    registry, unsigned = _load_registry()
+    router_class = registry.identify(result.text, result.headers, lambda path: requests.get(
+        "http://{0}{1}".format(ip, path), timeout=timeout).text)
+    if router_class is not None:
+        router_class = _resolve_router(router_class)
+    else:
+        router_class = next((Class for Class in unsigned if Class.check_model(result.text, ip)), None)
+    if router_class is None:
+        return None
+    return RouterResult(router_class, ip, result.headers)
+
+def _discover(test_ips, timeout, budget):
+    """Probe every candidate IP at the same time and return the recognized router earliest in the list. A router
+    is returned as soon as every IP before it has failed or gone unrecognized, or when the budget runs out"""
+    from requests.exceptions import ConnectionError, Timeout
+    import queue, threading, time
+    answers = queue.Queue()
+    pending, unreachable, unknown = object(), object(), object()
+    results = [pending] * len(test_ips)
+
+    def probe(index, ip):
+        try:
+            router = _probe(ip, timeout)
+            answers.put((index, router if router is not None else unknown))
+        except (ConnectionError, Timeout):
+            answers.put((index, unreachable))
+        except Exception as e:
+            answers.put((index, e))
+
+    # Daemon threads, so a probe waiting on a silent IP never holds up the exit of the process
+    for index, ip in enumerate(test_ips):
+        threading.Thread(target=probe, args=(index, ip), name="rout3r-probe", daemon=True).start()
+    deadline = time.monotonic() + budget
+    while pending in results:
+        try:
+            index, result = answers.get(timeout=max(0, deadline - time.monotonic()))
+        except queue.Empty:
+            break
+        results[index] = result
+        for result in results:
+            if result is pending:
+                break
+            if isinstance(result, RouterResult):
+                return result
+    for result in results:
+        if isinstance(result, RouterResult):
+            return result
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    if unknown in results:
+        raise NotImplementedError("The router at {ip} does not have a module, or cannot be determined automatically".format(
+            ip=test_ips[results.index(unknown)]))
     raise Exception("Unable to reach or determine router gateway IP address")
 
+def get_router(ip_address=DEFAULT_IP, test_fallbacks=ENABLE_FALLBACK_DEFAULT_IPS,
+               timeout=DISCOVERY_TIMEOUT, budget=DISCOVERY_BUDGET, use_cache=ENABLE_DISCOVERY_CACHE):
+    """Attempt to automatically get the router IP address and model, and optionally check fallback IPs
+
+    All candidate IPs are probed at the same time and ip_address is preferred: a fallback is only returned once
+    the probes of the IPs before it have failed, or when the budget runs out. The timeout applies to each probe
+    and the budget to the whole discovery. With use_cache, a previously discovered router is confirmed with a
+    single request instead."""
+    test_ips = [ip_address] + (FALLBACK_DEFAULT_IPS if test_fallbacks else [])
+    if not use_cache:
+        return _discover(test_ips, timeout, budget)
+    from rout3r import cache
+    discovery_cache = cache.DiscoveryCache()
+    for ip in test_ips:
+        router = discovery_cache.revalidate(ip, timeout)
+        if router is not None:
+            return router
+    router = _discover(test_ips, timeout, budget)
+    discovery_cache.put(router)
+    return router
@@ -2,152 +2,307 @@
 __author__ = "ex0dus"
 __version__ = "1.1"
 
-import requests, base64, rout3r
+import base64, re, rout3r, rout3r.aio, rout3r.clients, rout3r.metrics, rout3r.pagecache, rout3r.transport
 
 def _scrape(text, start, end):
     start_index = text.index(start) + len(start) + 1
     return text[start_index:text.index(end, start_index)]
 
+_CLIENT_PATTERN = re.compile(rb"([^|\s]+) [^|]*?&#40.([^|]*?)&#41;[^|/]*/[^|/]*/([^|/]*)/([^|/]*)/")
+_CONNECTION_TYPES = {b"802.11": "wifi", b"Ethernet": "ethernet"}
+
+def _iter_clients(data):
+    """Scan the active user list bytes, yielding (IP address, name, MAC address, connection type) per host"""
+    for match in _CLIENT_PATTERN.finditer(data):
+        ip_address, name, mac_address, connection_type = match.groups()
+        yield (ip_address.decode("ascii", "replace"), name.decode("utf-8", "replace"),
+               mac_address.decode("ascii", "replace"), _CONNECTION_TYPES.get(connection_type, "unknown"))
+
+@rout3r.metrics.timed("C1000A", "clients")
+def _parse_clients(data, as_table=False):
+    if as_table:
+        table = rout3r.clients.ClientTable()
+        for ip_address, name, mac_address, connection_type in _iter_clients(data):
+            table.append(name, ip_address, mac_address, connection_type)
+        return table
+    return [rout3r.RouterClient(name=name, ip_address=ip_address, mac_address=mac_address,
+                                connection_type=connection_type)
+            for ip_address, name, mac_address, connection_type in _iter_clients(data)]
+
+@rout3r.metrics.timed("C1000A", "firmware")
+def _parse_firmware(text):
+    return _scrape(text, "var soft_ver=", "'")
+
+@rout3r.metrics.timed("C1000A", "online")
+def _parse_online(text):
+    phy_status = _scrape(text, "var phy_status=", "'").lower()
+    ISP_status = _scrape(text, "var ISP_status=", "'").lower()
+    return not (("not" in phy_status) or ("not" in ISP_status))
+
+@rout3r.metrics.timed("C1000A", "ssid")
+def _parse_ssid(text):
+    return _scrape(text, "gv_ssid = ", "\"")
+
+@rout3r.metrics.timed("C1000A", "key")
+def _parse_key(text):
+    return _scrape(text, "gv_wpapsk_key  =", "\"")
+
+@rout3r.metrics.timed("C1000A", "status")
+def _parse_status(pages, as_table=False):
+    return rout3r.RouterStatus(
+
+        online=_parse_online(pages["modemstatus_home.html"]),
+        firmware=_parse_firmware(pages["modemstatus_home.html"]),
+        ssid=_parse_ssid(pages["wirelesssetup_basicsettings.html"]),
+        clients=_parse_clients(pages["modemstatus_activeuserlist_refresh.html"], as_table)
+
+    )
+
+STATUS_PAGES = ("modemstatus_home.html", "wirelesssetup_basicsettings.html", "modemstatus_activeuserlist_refresh.html")
+RAW_PAGES = ("modemstatus_activeuserlist_refresh.html",)
+
+def _login_params(username, password, session_key):
+    return {
+
+        "adminUserName": username,
+        "adminPassword": base64.b64encode(password.encode("utf-8")).decode("utf-8"),
+        "sessionKey": session_key,
+        "nothankyou": 1
+
+    }
+
+def _radio_params(enabled, ssid):
+    return {
+
+        "wlRadio": 1 if enabled else 0,
+        "wlSsid_wl0v0": ssid,
+        "aeiwlDisabledByGui": 0,
+        "needthankyou": 1
+
+    }
+
 class C1000A(rout3r.Router):
 
     manufacturer = "CenturyLink"
     model = "C1000A"
     firmware = "CAC003-31.30L.86"
+    signature = rout3r.Signature(root=["Actiontec C1000A", "var board_id='C1000A';"])
+    _failure_bytes = b"adminPassword"
     
-    def __init__(self, username, password, ip_address=rout3r.DEFAULT_IP):
+    def __init__(self, username, password, ip_address=rout3r.DEFAULT_IP, transport=None,
+                 page_ttl=rout3r.pagecache.PAGE_TTL, session_store=None):
         self.ip_address = ip_address
         self.logged_in = False
-        get = requests.get("http://{0}/".format(ip_address))
-        if "sessionKey" in get.text:
-            session_key = _scrape(get.text, "var sessionKey = '", "'")
-            requests.post("http://{0}/login.cgi".format(ip_address), params={
+        self._session = (transport or rout3r.transport.get_default()).session(self.model)
+        self._pages = rout3r.pagecache.PageCache(page_ttl)
+        self._session_key = None
+        self._open(username, password, session_store)
 
-                "adminUserName": username,
-                "adminPassword": base64.b64encode(password.encode("utf-8")),
-                "sessionKey": session_key,
-                "nothankyou": 1
+    def __del__(self):
+        if self._session_store is None:
+            self.logout()
 
-            })
-            result = requests.get("http://{0}/login.html".format(ip_address))
-            if "not valid" in result.text:
-                raise Exception("Invalid credentials")
+    def _login(self, relogin=False):
+        get = self._session.get("http://{0}/".format(self.ip_address))
+        if "sessionKey" in get.text:
+            self._session_key = _scrape(get.text, "var sessionKey = '", "'")
+            self._session.post("http://{0}/login.cgi".format(self.ip_address),
+                               params=_login_params(self._username, self._password, self._session_key))
+            if not relogin:
+                result = self._session.get("http://{0}/login.html".format(self.ip_address))
+                if "not valid" in result.text:
+                    raise Exception("Invalid credentials")
         self.logged_in = True
 
-    def __del__(self):
-        self.logout()
+    def _session_data(self):
+        return {"sessionKey": self._session_key}
+
+    def _load_session_data(self, data):
+        self._session_key = data.get("sessionKey")
+
+    def _get_page(self, page, raw=False):
+        def load():
+            response = self._session.get("http://{0}/{1}".format(self.ip_address, page))
+            if self._failure_bytes in response.content:
+                self._force_logout()
+            return response.content if raw else response.text
+        return self._pages.get(page, load)
 
-    def get_clients(self):
+    @rout3r.relogin
+    def _get_clients_raw(self):
         if not self.logged_in:
             raise rout3r.RouterLoggedOutException("This object has been logged out")
-        get = requests.get("http://{0}/modemstatus_activeuserlist_refresh.html".format(self.ip_address))
-        host_info = get.text.split("|")
-        clients = []
-        for host in host_info:
-            if " " not in host:
-                continue
-            client = rout3r.RouterClient()
-            space = host.index(" ")
-            client.ip_address = host[:space]
-            client.name = _scrape(host, "&#40", "&#41;")
-            host = host[host.index("/", host.index("/") + 1) + 1:]
-            slash = host.index("/")
-            client.mac_address = host[:slash]
-            host = host[slash + 1:]
-            connection_type = host[:host.index("/")]
-            if connection_type == "802.11":
-                client.connection_type = "wifi"
-            elif connection_type == "Ethernet":
-                client.connection_type = connection_type.lower()
-            else:
-                client.connection_type = "unknown"
-            clients.append(client)
-        return clients
+        return self._get_page("modemstatus_activeuserlist_refresh.html", raw=True)
 
+    def _parse_clients(self, data):
+        return _parse_clients(data, True)
+
+    def get_clients(self, as_table=False):
+        return _parse_clients(self._get_clients_raw(), as_table)
+
+    @rout3r.relogin
     def get_firmware(self):
         if not self.logged_in:
             raise rout3r.RouterLoggedOutException("This object has been logged out")
-        get = requests.get("http://{0}/modemstatus_home.html".format(self.ip_address))
-        return _scrape(get.text, "var soft_ver=", "'")
+        text = self._get_page("modemstatus_home.html")
+        return _parse_firmware(text)
 
+    @rout3r.relogin
     def is_online(self):
         if not self.logged_in:
             return False
-        get = requests.get("http://{0}/modemstatus_home.html".format(self.ip_address))
-        phy_status = _scrape(get.text, "var phy_status=", "'").lower()
-        ISP_status = _scrape(get.text, "var ISP_status=", "'").lower()
-        return not (("not" in phy_status) or ("not" in ISP_status))
+        text = self._get_page("modemstatus_home.html")
+        return _parse_online(text)
+
+    @rout3r.relogin
+    def _get_status_pages(self):
+        if not self.logged_in:
+            raise rout3r.RouterLoggedOutException("This object has been logged out")
+        return rout3r._fetch_all({page: lambda page=page: self._get_page(page, page in RAW_PAGES)
+                                  for page in STATUS_PAGES})
+
+    _parse_status = staticmethod(_parse_status)
+
+    def get_status(self):
+        return _parse_status(self._get_status_pages())
 
+    @rout3r.relogin
     def reboot(self):
         if not self.logged_in:
             raise rout3r.RouterLoggedOutException("This object has been logged out")
-        result = requests.post("http://{0}/rebootinfo.cgi".format(self.ip_address), params={
+        rout3r.metrics.increment(rout3r.metrics.REBOOTS, self.model)
+        result = self._session.post("http://{0}/rebootinfo.cgi".format(self.ip_address), params={
 
             "Reboot": 1
 
         })
+        self._pages.invalidate()
         if result.status_code == 200:
             self.logged_in = False
             return True
         return False
 
+    @rout3r.relogin
     def get_ssid(self):
         if not self.logged_in:
             raise rout3r.RouterLoggedOutException("This object has been logged out")
-        get = requests.get("http://{0}/wirelesssetup_basicsettings.html".format(self.ip_address))
-        return _scrape(get.text, "gv_ssid = ", "\"")
+        text = self._get_page("wirelesssetup_basicsettings.html")
+        return _parse_ssid(text)
 
+    @rout3r.relogin
     def set_ssid(self, ssid):
         if not self.logged_in:
             raise rout3r.RouterLoggedOutException("This object has been logged out")
-        post = requests.post("http://{0}/wirelesssetup_basicsettings.wl".format(self.ip_address), params={
-
-            "wlRadio": 1,
-            "wlSsid_wl0v0": ssid,
-            "aeiwlDisabledByGui": 0,
-            "needthankyou": 1
-
-        })
+        post = self._session.post("http://{0}/wirelesssetup_basicsettings.wl".format(self.ip_address),
+                                  params=_radio_params(True, ssid))
+        self._pages.invalidate("wirelesssetup_basicsettings.html")
 
+    @rout3r.relogin
     def enable_radio(self):
         if not self.logged_in:
             raise rout3r.RouterLoggedOutException("This object has been logged out")
-        post = requests.post("http://{0}/wirelesssetup_basicsettings.wl".format(self.ip_address), params={
-
-            "wlRadio": 1,
-            "wlSsid_wl0v0": self.get_ssid(),
-            "aeiwlDisabledByGui": 0,
-            "needthankyou": 1
-
-        })
+        post = self._session.post("http://{0}/wirelesssetup_basicsettings.wl".format(self.ip_address),
+                                  params=_radio_params(True, self.get_ssid()))
+        self._pages.invalidate("wirelesssetup_basicsettings.html")
 
+    @rout3r.relogin
     def disable_radio(self):
         if not self.logged_in:
             raise rout3r.RouterLoggedOutException("This object has been logged out")
-        post = requests.post("http://{0}/wirelesssetup_basicsettings.wl".format(self.ip_address), params={
-
-            "wlRadio": 0,
-            "wlSsid_wl0v0": self.get_ssid(),
-            "aeiwlDisabledByGui": 0,
-            "needthankyou": 1
-
-        })
+        post = self._session.post("http://{0}/wirelesssetup_basicsettings.wl".format(self.ip_address),
+                                  params=_radio_params(False, self.get_ssid()))
+        self._pages.invalidate("wirelesssetup_basicsettings.html")
 
+    @rout3r.relogin
     def get_key(self):
         if not self.logged_in:
             raise rout3r.RouterLoggedOutException("This object has been logged out")
-        get = requests.get("http://{0}/wirelesssetup_basicsettings.html".format(self.ip_address))
-        return _scrape(get.text, "gv_wpapsk_key  =", "\"")
+        text = self._get_page("wirelesssetup_basicsettings.html")
+        return _parse_key(text)
 
     def logout(self):
+        self._logged_out = True
+        self._pages.invalidate()
+        if self._session_store is not None:
+            self._session_store.delete(self.ip_address, self._username)
         if self.logged_in:
             self.logged_in = False
             try:
-                requests.post("http://{0}/logout.cgi".format(self.ip_address))
+                self._session.post("http://{0}/logout.cgi".format(self.ip_address))
             except:
                 pass
 
     @staticmethod
     def check_model(gateway, ip):
-        return ("Actiontec C1000A" in gateway) or ("var board_id='C1000A';" in gateway)
+        return C1000A.signature.match(gateway)
+
+class AsyncC1000A(rout3r.aio.AsyncRouter):
+
+    manufacturer = C1000A.manufacturer
+    model = C1000A.model
+    firmware = C1000A.firmware
+
+    async def login(self):
+        text = await self._get("/")
+        if "sessionKey" in text:
+            session_key = _scrape(text, "var sessionKey = '", "'")
+            await self._request("POST", "/login.cgi", params=_login_params(self._username, self._password, session_key))
+            if "not valid" in await self._get("/login.html"):
+                raise Exception("Invalid credentials")
+        self.logged_in = True
+
+    async def _get_clients_raw(self):
+        if not self.logged_in:
+            raise rout3r.RouterLoggedOutException("This object has been logged out")
+        return await self._get_page("/modemstatus_activeuserlist_refresh.html", raw=True)
+
+    def _parse_clients(self, data):
+        return _parse_clients(data, True)
+
+    async def get_clients(self, as_table=False):
+        return _parse_clients(await self._get_clients_raw(), as_table)
+
+    async def get_firmware(self):
+        if not self.logged_in:
+            raise rout3r.RouterLoggedOutException("This object has been logged out")
+        return _parse_firmware(await self._get_page("/modemstatus_home.html"))
+
+    async def is_online(self):
+        if not self.logged_in:
+            return False
+        return _parse_online(await self._get_page("/modemstatus_home.html"))
+
+    async def _get_status_pages(self):
+        if not self.logged_in:
+            raise rout3r.RouterLoggedOutException("This object has been logged out")
+        import asyncio
+        texts = await asyncio.gather(*[self._get_page("/" + page, raw=page in RAW_PAGES) for page in STATUS_PAGES])
+        return dict(zip(STATUS_PAGES, texts))
+
+    _parse_status = staticmethod(_parse_status)
+
+    async def get_status(self):
+        return _parse_status(await self._get_status_pages())
+
+    async def reboot(self):
+        if not self.logged_in:
+            raise rout3r.RouterLoggedOutException("This object has been logged out")
+        rout3r.metrics.increment(rout3r.metrics.REBOOTS, self.model)
+        status, _ = await self._request("POST", "/rebootinfo.cgi", params={"Reboot": 1})
+        self._pages.invalidate()
+        if status == 200:
+            self.logged_in = False
+            return True
+        return False
+
+    async def logout(self):
+        if self.logged_in:
+            self.logged_in = False
+            try:
+                await self._request("POST", "/logout.cgi")
+            except:
+                pass
+        await self._close_session()
 
 __routers__ = [C1000A]
+__async_routers__ = [AsyncC1000A]
@@ -0,0 +1,304 @@
+"""Asynchronous router interfaces for rout3r
+
+AsyncRouter mirrors rout3r.Router with coroutines so that a single event loop can poll many gateways at once.
+Router modules provide their asynchronous classes in an __async_routers__ list. Requires aiohttp, which is
+only imported once an AsyncTransport is used."""
+__author__ = "ex0dus"
+__version__ = "1.0"
+
+import abc, time, rout3r, rout3r.metrics, rout3r.pagecache, rout3r.transport
+
+ASYNC_LIMIT = 1000
+"""How many connections an AsyncTransport keeps open at once across all routers"""
+
+class AsyncTransport:
+    """Connection pool and request defaults shared by asynchronous router sessions"""
+
+    def __init__(self, timeout=rout3r.transport.DEFAULT_TIMEOUT, retries=rout3r.transport.DEFAULT_RETRIES,
+                 backoff=rout3r.transport.DEFAULT_BACKOFF, limit=ASYNC_LIMIT,
+                 limit_per_host=rout3r.transport.POOL_MAXSIZE):
+        import aiohttp
+        self.timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        self.retries = retries
+        self.backoff = backoff
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self._connector = None
+        self._closer = None
+
+    def session(self):
+        """Create a session with its own cookies which shares this transport's connections. Must be called
+        from a running event loop"""
+        import asyncio, aiohttp
+        # A connector is bound to the event loop it was created on, so a later asyncio.run() needs a new one
+        loop = asyncio.get_running_loop()
+        if self._connector is None or self._connector.closed or self._connector._loop is not loop:
+            self._connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host)
+            self._closer = loop.create_task(self._close_on_shutdown(self._connector))
+        return aiohttp.ClientSession(connector=self._connector, connector_owner=False, timeout=self.timeout,
+                                     cookie_jar=aiohttp.CookieJar(unsafe=True))
+
+    @staticmethod
+    async def _close_on_shutdown(connector):
+        """Wait until the event loop cancels its remaining tasks (as asyncio.run does before closing it) and close
+        the connector then, so its pooled connections do not outlive the loop"""
+        import asyncio
+        try:
+            await asyncio.get_running_loop().create_future()
+        except asyncio.CancelledError:
+            await connector.close()
+
+    async def close(self):
+        """Close every pooled connection. Connections are also closed when asyncio.run() finishes"""
+        import asyncio
+        if self._connector is not None and self._connector._loop is asyncio.get_running_loop():
+            self._closer.cancel()
+            await self._connector.close()
+
+_default = None
+
+def get_default():
+    """Return the transport used by asynchronous routers which are not given one"""
+    global _default
+    if _default is None:
+        _default = AsyncTransport()
+    return _default
+
+def set_default(transport):
+    """Replace the transport used by asynchronous routers which are not given one"""
+    global _default
+    _default = transport
+
+class AsyncRouter(object, metaclass=abc.ABCMeta):
+    """An abstract asynchronous router class which all module asynchronous router classes should extend
+
+    Creating the object does not contact the router, await login() (or use "async with") first"""
+    manufacturer = None
+    model = None
+    firmware = None
+
+    def __init__(self, username, password, ip_address=rout3r.DEFAULT_IP, transport=None,
+                 page_ttl=rout3r.pagecache.PAGE_TTL):
+        self.ip_address = ip_address
+        self.logged_in = False
+        self._username = username
+        self._password = password
+        self._transport = transport or get_default()
+        self._session = None
+        self._pages = rout3r.pagecache.AsyncPageCache(page_ttl)
+
+    async def __aenter__(self):
+        await self.login()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.logout()
+
+    async def _request(self, method, path, encoding=None, raw=False, **kwargs):
+        """Send a request to the router and return the response status and text (or bytes if raw). Idempotent
+        requests are retried with backoff like rout3r.transport does, and recorded in rout3r.metrics"""
+        import asyncio, aiohttp
+        if self._session is None:
+            self._session = self._transport.session()
+        url = "http://{0}{1}".format(self.ip_address, path)
+        start = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    async with self._session.request(method, url, **kwargs) as response:
+                        if raw:
+                            return response.status, await response.read()
+                        return response.status, await response.text(encoding=encoding)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if method != "GET" or attempt >= self._transport.retries:
+                        rout3r.metrics.increment(rout3r.metrics.ERRORS, self.model)
+                        raise
+                await asyncio.sleep(self._transport.backoff * 2 ** attempt)
+                attempt += 1
+                rout3r.metrics.increment(rout3r.metrics.RETRIES, self.model)
+        finally:
+            rout3r.metrics.observe(self.model, path, rout3r.metrics.REQUEST, time.perf_counter() - start)
+
+    async def _get(self, path, **kwargs):
+        return (await self._request("GET", path, **kwargs))[1]
+
+    async def _get_page(self, path, **kwargs):
+        """Get the text (or bytes if raw) of a router page through the page cache"""
+        return await self._pages.get(path, lambda: self._get(path, **kwargs))
+
+    async def _close_session(self):
+        self._pages.invalidate()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    """This method returns a RouterStatus snapshot of the router by calling the individual getters concurrently"""
+    async def get_status(self):
+        import asyncio
+        names = ["online", "firmware", "clients", "uptime"]
+        getters = [self.is_online, self.get_firmware, self.get_clients, getattr(self, "get_uptime", None)]
+
+        async def call(getter):
+            if getter is None:
+                return None
+            try:
+                return await getter()
+            except NotImplementedError:
+                return None
+
+        values = await asyncio.gather(*[call(getter) for getter in getters])
+        return rout3r.RouterStatus(**dict(zip(names, values)))
+
+    """Asynchronous router classes may return the raw pages get_status reads from this method, see
+rout3r.Router._get_status_pages"""
+    async def _get_status_pages(self):
+        raise NotImplementedError("{0} is missing this implementation".format(self.__class__.__name__))
+
+    _parse_status = None
+
+    """Asynchronous router classes may return the raw client list response from this method and parse it into a
+ClientTable with _parse_clients(data), see rout3r.Router.watch_clients"""
+    async def _get_clients_raw(self):
+        raise NotImplementedError("{0} is missing this implementation".format(self.__class__.__name__))
+
+    def _parse_clients(self, data):
+        raise NotImplementedError("{0} is missing this implementation".format(self.__class__.__name__))
+
+    """This method polls the clients connected to the router every interval seconds and yields a
+rout3r.clients.ClientEvent for each client which joined, left or changed since the last poll (async for)"""
+    async def watch_clients(self, interval=None, initial=True):
+        import asyncio, rout3r.clients
+        if interval is None:
+            interval = rout3r.clients.WATCH_INTERVAL
+        feed = rout3r.clients.ClientFeed(self._parse_clients, initial)
+        while True:
+            try:
+                events = feed.update(await self._get_clients_raw())
+            except NotImplementedError:
+                events = feed.update_table(await self.get_clients(as_table=True))
+            for event in events:
+                yield event
+            await asyncio.sleep(interval)
+
+    """This method should log in to the router gateway"""
+    @abc.abstractmethod
+    async def login(self):
+        raise NotImplementedError("{0} is missing this implementation".format(self.__class__.__name__))
+
+    """This method should check the status of the WAN connection in the router"""
+    @abc.abstractmethod
+    async def is_online(self):
+        raise NotImplementedError("{0} is missing this implementation".format(self.__class__.__name__))
+
+    """This method should return the clients connected to the router as a list of RouterClient objects, or a
+rout3r.clients.ClientTable when as_table is True"""
+    @abc.abstractmethod
+    async def get_clients(self, as_table=False):
+        raise NotImplementedError("{0} is missing this implementation".format(self.__class__.__name__))
+
+    """This method should return the router firmware version as an int or string"""
+    @abc.abstractmethod
+    async def get_firmware(self):
+        raise NotImplementedError("{0} is missing this implementation".format(self.__class__.__name__))
+
+    """This method should reboot the router"""
+    @abc.abstractmethod
+    async def reboot(self):
+        raise NotImplementedError("{0} is missing this implementation".format(self.__class__.__name__))
+
+    """This method should end the current session with the router gateway and not raise any exceptions"""
+    @abc.abstractmethod
+    async def logout(self):
+        raise NotImplementedError("{0} is missing this implementation".format(self.__class__.__name__))
+
+def _async_class(router_class):
+    """Return the asynchronous counterpart of a router class from its module's __async_routers__ list"""
+    import sys
+    for async_class in getattr(sys.modules[router_class.__module__], "__async_routers__", ()):
+        if async_class.model == router_class.model:
+            return async_class
+    raise NotImplementedError("{0} does not have an asynchronous implementation".format(router_class.__name__))
+
+async def _probe(session, ip, timeout):
+    """Fetch the gateway page at the IP address and return a RouterResult for the asynchronous router class if
+    a module recognizes it, otherwise None"""
+    import asyncio
+
+    async def fetch(path):
+        async with session.get("http://{0}{1}".format(ip, path), timeout=timeout) as response:
+            return await response.text(), response.headers
+
+    text, headers = await fetch("/")
+    registry, unsigned = rout3r._load_registry()
+    pages = {}
+    router_class = None
+    for key, signature in registry.candidates(text):
+        for path in signature.pages:
+            if path not in pages:
+                pages[path] = (await fetch(path))[0]
+        if signature.match_secondary(headers, pages.__getitem__):
+            router_class = rout3r._resolve_router(key)
+            break
+    else:
+        loop = asyncio.get_running_loop()
+        for Class in unsigned:
+            if await loop.run_in_executor(None, Class.check_model, text, ip):
+                router_class = Class
+                break
+    if router_class is None:
+        return None
+    return rout3r.RouterResult(_async_class(router_class), ip, headers)
+
+async def get_router(ip_address=rout3r.DEFAULT_IP, test_fallbacks=rout3r.ENABLE_FALLBACK_DEFAULT_IPS,
+                     timeout=rout3r.DISCOVERY_TIMEOUT, budget=rout3r.DISCOVERY_BUDGET, transport=None):
+    """Asynchronous rout3r.get_router, returning a RouterResult for the asynchronous router class. As with
+    rout3r.get_router, ip_address is preferred over the fallbacks"""
+    import asyncio, aiohttp
+    test_ips = [ip_address] + (rout3r.FALLBACK_DEFAULT_IPS if test_fallbacks else [])
+    probe_timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+    session = (transport or get_default()).session()
+    pending, unreachable, unknown = object(), object(), object()
+    results = [pending] * len(test_ips)
+
+    async def probe(index, ip):
+        try:
+            router = await _probe(session, ip, probe_timeout)
+            return index, router if router is not None else unknown
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return index, unreachable
+        except Exception as e:
+            return index, e
+
+    probes = {asyncio.ensure_future(probe(index, ip)) for index, ip in enumerate(test_ips)}
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + budget
+    try:
+        # The router earliest in test_ips is returned once every IP before it has failed or gone unrecognized
+        while probes:
+            done, probes = await asyncio.wait(probes, timeout=max(0, deadline - loop.time()),
+                                              return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for finished in done:
+                index, result = finished.result()
+                results[index] = result
+            for result in results:
+                if result is pending:
+                    break
+                if isinstance(result, rout3r.RouterResult):
+                    return result
+    finally:
+        for remaining in probes:
+            remaining.cancel()
+        await session.close()
+    for result in results:
+        if isinstance(result, rout3r.RouterResult):
+            return result
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    if unknown in results:
+        raise NotImplementedError("The router at {ip} does not have a module, or cannot be determined automatically".format(
+            ip=test_ips[results.index(unknown)]))
+    raise Exception("Unable to reach or determine router gateway IP address")
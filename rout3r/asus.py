@@ -2,7 +2,7 @@
 __author__ = "ex0dus"
 __version__ = "1.0"
 
-import requests, base64, rout3r, json, datetime, random, urllib.parse
+import requests, base64, io, rout3r, rout3r.aio, rout3r.clients, rout3r.metrics, rout3r.pagecache, rout3r.transport, json, datetime, random, urllib.parse
 import xml.etree.ElementTree as ET
 import time as _time
 
@@ -19,127 +19,208 @@ def _encode_authorization(username, password):
 def _make_headers(page):
     return { "Host": "router.asus.com", "Referer": "http://router.asus.com/" + str(page) }
 
+def _login_data(username, password):
+    return {
+
+        "group_id": "",
+        "action_mode": "",
+        "action_script": "",
+        "action_wait": 5,
+        "current_page": "Main_Login.asp",
+        "next_page": "index.asp",
+        "login_authorization": _encode_authorization(username, password)
+
+    }
+
 class AsusRouterClient(rout3r.RouterClient):
     """Asus-specific router client characteristics"""
-    vendor = None
-    internet_allowed = True
-    ip_method = None
-    nickname = None
+    __slots__ = ("vendor", "internet_allowed", "ip_method", "nickname")
+
+    def __init__(self, vendor=None, internet_allowed=True, ip_method=None, nickname=None, **kwargs):
+        super().__init__(**kwargs)
+        self.vendor = vendor
+        self.internet_allowed = internet_allowed
+        self.ip_method = ip_method
+        self.nickname = nickname
+
+CONNECTION_TYPES = ("wired", "wifi 2.4GHz", "wifi 5GHz/5GHz-1", "wifi 5Ghz-2")
+
+@rout3r.metrics.timed("RT-AC68U", "uptime")
+def _parse_uptime(data):
+    for _, element in ET.iterparse(io.BytesIO(data), events=("end",)):
+        text = element.text
+        if text and "secs since boot" in text:
+            return datetime.timedelta(seconds=int(text[text.index("(") + 1:text.index("secs")]))
+    return None
+
+def _networkmapd(data):
+    """Return the networkmapd client object of update_clients.asp, decoded from the bytes by the C JSON decoder"""
+    start = data.index(b"fromNetworkmapd :") + len(b"fromNetworkmapd :")
+    # The list is followed by a comma, found by index so that the payload is only copied by the one slice
+    end = data.rindex(b",", start, data.index(b"nmpClient", start))
+    return json.loads(data[start:end])[0]
+
+def _connection_type(connection_type):
+    if connection_type:
+        try:
+            return CONNECTION_TYPES[int(connection_type)]
+        except:
+            pass
+    return "unknown"
+
+@rout3r.metrics.timed("RT-AC68U", "clients")
+def _parse_clients(data, as_table=False):
+    result = rout3r.clients.ClientTable() if as_table else list()
+    for key, element in _networkmapd(data).items():
+        if key == "maclist":
+            continue
+        if as_table:
+            result.append(element["name"], element["ip"], key, _connection_type(element["isWL"]),
+                          int(element["rssi"]), element["isOnline"] == 1)
+            continue
+        result.append(AsusRouterClient(
+
+            name=element["name"],
+            ip_address=element["ip"],
+            mac_address=key,
+            is_online=element["isOnline"] == 1,
+            vendor=element["vendor"] or None,
+            nickname=element["nickName"] or None,
+            ip_method=element["ipMethod"],
+            internet_allowed=element["internetMode"] == "allow",
+            radio_strength=int(element["rssi"]),
+            connection_type=_connection_type(element["isWL"])
+
+        ))
+    return result
+
+@rout3r.metrics.timed("RT-AC68U", "status")
+def _parse_status(pages, as_table=False):
+    return rout3r.RouterStatus(
+
+        online=_parse_online(pages["index.asp"]),
+        firmware=_parse_firmware(pages["index.asp"]),
+        ssid=_parse_ssid(pages["Advanced_Wireless_Content.asp"]),
+        clients=_parse_clients(pages["update_clients.asp"], as_table),
+        uptime=_parse_uptime(pages["ajax_status.xml"])
+
+    )
+
+@rout3r.metrics.timed("RT-AC68U", "firmware")
+def _parse_firmware(text):
+    return _scrape(text, "\"firmver\" value=", "\">")
+
+@rout3r.metrics.timed("RT-AC68U", "online")
+def _parse_online(text):
+    return _scrape(text, "wanlink_statusstr() { return ", "'") == "Connected"
+
+@rout3r.metrics.timed("RT-AC68U", "ssid")
+def _parse_ssid(text):
+    return urllib.parse.unquote(_scrape(text, "\"wl_ssid_org\" value=", "\">"))
+
+@rout3r.metrics.timed("RT-AC68U", "key")
+def _parse_key(text):
+    return urllib.parse.unquote(_scrape(text, "\"wl_wpa_psk_org\" value=", "\">"))
 
 class RTAC68U(rout3r.Router):
     
     manufacturer = "Asus"
     model = "RT-AC68U"
     firmware = "3.0.0.4"
-    connection_types = ("wired", "wifi 2.4GHz", "wifi 5GHz/5GHz-1", "wifi 5Ghz-2")
+    connection_types = CONNECTION_TYPES
     _failure_str = "<script>top.location.href='/Main_Login.asp';"
+    _failure_bytes = _failure_str.encode("utf-8")
+    signature = rout3r.Signature(root=["top.location.href='/Main_Login.asp';"], pages={"/Main_Login.asp": ["RT-AC68U"]})
     
-    def __init__(self, username, password, ip_address=rout3r.DEFAULT_IP):
+    def __init__(self, username, password, ip_address=rout3r.DEFAULT_IP, transport=None,
+                 page_ttl=rout3r.pagecache.PAGE_TTL, session_store=None):
         self.ip_address = ip_address
-        self._session = requests.Session()
-        self._session.get("http://{}/Main_Login.asp".format(ip_address))
-        response = self._session.post("http://{}/login.cgi".format(ip_address), data={
+        self.logged_in = False
+        self._session = (transport or rout3r.transport.get_default()).session(self.model)
+        self._pages = rout3r.pagecache.PageCache(page_ttl)
+        self._open(username, password, session_store)
 
-                "group_id": "",
-                "action_mode": "",
-                "action_script": "",
-                "action_wait": 5,
-                "current_page": "Main_Login.asp",
-                "next_page": "index.asp",
-                "login_authorization": _encode_authorization(username, password)
+    def __del__(self):
+        if self._session_store is None:
+            self.logout()
 
-        }, headers=_make_headers("Main_Login.asp"))
+    def _login(self, relogin=False):
+        if not relogin:
+            self._session.get("http://{}/Main_Login.asp".format(self.ip_address))
+        self._session.cookies.pop("asus_token", None)
+        self._session.post("http://{}/login.cgi".format(self.ip_address), data=_login_data(self._username, self._password),
+                           headers=_make_headers("Main_Login.asp"))
         if "asus_token" in self._session.cookies:
             self.logged_in = True
         else:
             raise Exception("Invalid credentials")
 
-    def __del__(self):
-        self.logout()
-
-    def _get_ajax_status(self):
-        result = self._session.get("http://{}/ajax_status.xml".format(self.ip_address), params={
-
-            "hash": random.uniform(0, 1)
-        
-        }, headers=_make_headers("index.asp"))
-        result.encoding = "utf-8-sig"
-        return result.text
-
-    def _get_advanced_wireless_content(self):
-        return self._session.get("http://{}/Advanced_Wireless_Content.asp".format(self.ip_address),
-                                 headers=_make_headers("Advanced_Wireless_Content.asp")).text
+    def _get_page(self, page, referer="index.asp", params=None, raw=False):
+        def load():
+            response = self._session.get("http://{}/{}".format(self.ip_address, page), params=params,
+                                         headers=_make_headers(referer))
+            if raw:
+                if self._failure_bytes in response.content:
+                    self._force_logout()
+                return response.content
+            if self._failure_str in response.text:
+                self._force_logout()
+            return response.text
+        return self._pages.get(page, load)
 
+    @rout3r.relogin
     def get_uptime(self):
-        result = self._get_ajax_status()
-        if self._failure_str in result:
-            self._force_logout()
-        tree = ET.fromstring(result)
-        for x in tree:
-            if x.text and "secs since boot" in x.text:
-                return datetime.timedelta(seconds=
-                                         int(x.text[x.text.index("(") + 1:x.text.index("secs")]))
-        return None
-
-    def get_clients(self):
+        return _parse_uptime(self._get_page("ajax_status.xml", params={"hash": random.uniform(0, 1)}, raw=True))
+
+    @rout3r.relogin
+    def _get_clients_raw(self):
         if not self.logged_in:
             raise rout3r.RouterLoggedOutException("This object has been logged out")
-        response = self._session.get("http://{}/update_clients.asp".format(self.ip_address), params={
-
-            "_": millis()
-            
-        }, headers=_make_headers("index.asp"))
-        if self._failure_str in response.text:
-            self._force_logout()
-        response_json = json.loads(_scrape(response.text, "fromNetworkmapd :", "nmpClient").strip()[:-1])
-        result = list()
-        for key, element in response_json[0].items():
-            if key == "maclist":
-                continue
-            client = AsusRouterClient()
-            client.name = element["name"]
-            client.ip_address = element["ip"]
-            client.mac_address = key
-            client.is_online = element["isOnline"] == 1
-            vendor = element["vendor"]
-            client.vendor = None if not vendor else vendor
-            nickname = element["nickName"]
-            client.nickname = None if not nickname else nickname
-            client.ip_method = element["ipMethod"]
-            client.internet_allowed = element["internetMode"] == "allow"
-            client.radio_strength = int(element["rssi"])
-            connection_type = element["isWL"]
-            if connection_type:
-                try:
-                    client.connection_type = self.connection_types[int(connection_type)]
-                except:
-                    client.connection_type = "unknown"
-            else:
-                client.connection_type = "unknown"
-            result.append(client)
-        return result
+        return self._get_page("update_clients.asp", params={"_": millis()}, raw=True)
+
+    def _parse_clients(self, data):
+        return _parse_clients(data, True)
 
+    def get_clients(self, as_table=False):
+        return _parse_clients(self._get_clients_raw(), as_table)
+
+    @rout3r.relogin
     def get_firmware(self):
         if not self.logged_in:
             raise rout3r.RouterLoggedOutException("This object has been logged out")
-        response = self._session.get("http://{}/index.asp".format(self.ip_address),
-                                     headers=_make_headers("index.asp"))
-        if self._failure_str in response.text:
-            self._force_logout()
-        return _scrape(response.text, "\"firmver\" value=", "\">")
+        return _parse_firmware(self._get_page("index.asp"))
 
+    @rout3r.relogin
     def is_online(self):
         if not self.logged_in:
             return False
-        response = self._session.get("http://{}/index.asp".format(self.ip_address),
-                                     headers=_make_headers("index.asp"))
-        if self._failure_str in response.text:
-            self._force_logout()
-        return _scrape(response.text, "wanlink_statusstr() { return ", "'") == "Connected"
+        return _parse_online(self._get_page("index.asp"))
+
+    @rout3r.relogin
+    def _get_status_pages(self):
+        if not self.logged_in:
+            raise rout3r.RouterLoggedOutException("This object has been logged out")
+        return rout3r._fetch_all({
+
+            "index.asp": lambda: self._get_page("index.asp"),
+            "Advanced_Wireless_Content.asp": lambda: self._get_page("Advanced_Wireless_Content.asp",
+                                                                    "Advanced_Wireless_Content.asp"),
+            "update_clients.asp": lambda: self._get_page("update_clients.asp", params={"_": millis()}, raw=True),
+            "ajax_status.xml": lambda: self._get_page("ajax_status.xml", params={"hash": random.uniform(0, 1)},
+                                                      raw=True)
 
+        })
+
+    _parse_status = staticmethod(_parse_status)
+
+    def get_status(self):
+        return _parse_status(self._get_status_pages())
+
+    @rout3r.relogin
     def reboot(self): # Untested
         if not self.logged_in:
             raise rout3r.RouterLoggedOutException("This object has been logged out")
+        rout3r.metrics.increment(rout3r.metrics.REBOOTS, self.model)
         result = self._session.post("http://{}/apply.cgi".format(self.ip_address), data={
 
                 "action_mode": "reboot",
@@ -147,44 +228,44 @@ class RTAC68U(rout3r.Router):
                 "action_wait": 140
 
         }, headers=_make_headers("apply.asp"))
+        self._pages.invalidate()
         if result.status_code == 200:
             self.logged_in = False
             return True
         return False
 
+    @rout3r.relogin
     def get_key(self):
         if not self.logged_in:
             raise rout3r.RouterLoggedOutException("This object has been logged out")
-        result = self._get_advanced_wireless_content()
-        if self._failure_str in result:
-            self._force_logout()
-        return urllib.parse.unquote(_scrape(result, "\"wl_wpa_psk_org\" value=", "\">"))
+        return _parse_key(self._get_page("Advanced_Wireless_Content.asp", "Advanced_Wireless_Content.asp"))
 
+    @rout3r.relogin
     def set_ssid(self, ssid):
         if not self.logged_in:
             raise rout3r.RouterLoggedOutException("This object has been logged out")
 
+    @rout3r.relogin
     def enable_radio(self):
         if not self.logged_in:
             raise rout3r.RouterLoggedOutException("This object has been logged out")
 
+    @rout3r.relogin
     def disable_radio(self):
         if not self.logged_in:
             raise rout3r.RouterLoggedOutException("This object has been logged out")
 
+    @rout3r.relogin
     def get_ssid(self):
         if not self.logged_in:
             raise rout3r.RouterLoggedOutException("This object has been logged out")
-        result = self._get_advanced_wireless_content()
-        if self._failure_str in result:
-            self._force_logout()
-        return urllib.parse.unquote(_scrape(result, "\"wl_ssid_org\" value=", "\">"))
-
-    def _force_logout(self):
-        self.logout()
-        raise rout3r.RouterLoggedOutException("This object is now logged out")
+        return _parse_ssid(self._get_page("Advanced_Wireless_Content.asp", "Advanced_Wireless_Content.asp"))
 
     def logout(self):
+        self._logged_out = True
+        self._pages.invalidate()
+        if self._session_store is not None:
+            self._session_store.delete(self.ip_address, self._username)
         if self.logged_in:
             self.logged_in = False
             try:
@@ -195,7 +276,110 @@ class RTAC68U(rout3r.Router):
 
     @staticmethod
     def check_model(gateway, ip):
-        return "top.location.href='/Main_Login.asp';" in gateway \
-               and "RT-AC68U" in requests.get("http://{}/Main_Login.asp".format(ip)).text
+        return RTAC68U.signature.match(gateway, fetch=lambda path: requests.get(
+            "http://{}{}".format(ip, path), timeout=rout3r.DISCOVERY_TIMEOUT).text)
+
+class AsyncRTAC68U(rout3r.aio.AsyncRouter):
+
+    manufacturer = RTAC68U.manufacturer
+    model = RTAC68U.model
+    firmware = RTAC68U.firmware
+    connection_types = CONNECTION_TYPES
+    _failure_str = RTAC68U._failure_str
+    _failure_bytes = RTAC68U._failure_bytes
+
+    async def login(self):
+        await self._get("/Main_Login.asp")
+        await self._request("POST", "/login.cgi", data=_login_data(self._username, self._password),
+                            headers=_make_headers("Main_Login.asp"))
+        if any(cookie.key == "asus_token" for cookie in self._session.cookie_jar):
+            self.logged_in = True
+        else:
+            raise Exception("Invalid credentials")
+
+    async def _get_page(self, path, referer="index.asp", raw=False, **kwargs):
+        async def load():
+            result = await self._get(path, headers=_make_headers(referer), raw=raw, **kwargs)
+            if (self._failure_bytes if raw else self._failure_str) in result:
+                await self._force_logout()
+            return result
+        return await self._pages.get(path, load)
+
+    async def get_uptime(self):
+        return _parse_uptime(await self._get_page("/ajax_status.xml", params={"hash": random.uniform(0, 1)},
+                                                  raw=True))
+
+    async def _get_clients_raw(self):
+        if not self.logged_in:
+            raise rout3r.RouterLoggedOutException("This object has been logged out")
+        return await self._get_page("/update_clients.asp", params={"_": millis()}, raw=True)
+
+    def _parse_clients(self, data):
+        return _parse_clients(data, True)
+
+    async def get_clients(self, as_table=False):
+        return _parse_clients(await self._get_clients_raw(), as_table)
+
+    async def get_firmware(self):
+        if not self.logged_in:
+            raise rout3r.RouterLoggedOutException("This object has been logged out")
+        return _parse_firmware(await self._get_page("/index.asp"))
+
+    async def is_online(self):
+        if not self.logged_in:
+            return False
+        return _parse_online(await self._get_page("/index.asp"))
+
+    async def _get_status_pages(self):
+        if not self.logged_in:
+            raise rout3r.RouterLoggedOutException("This object has been logged out")
+        import asyncio
+        pages = ("index.asp", "Advanced_Wireless_Content.asp", "update_clients.asp", "ajax_status.xml")
+        texts = await asyncio.gather(
+
+            self._get_page("/index.asp"),
+            self._get_page("/Advanced_Wireless_Content.asp", "Advanced_Wireless_Content.asp"),
+            self._get_page("/update_clients.asp", params={"_": millis()}, raw=True),
+            self._get_page("/ajax_status.xml", params={"hash": random.uniform(0, 1)}, raw=True)
+
+        )
+        return dict(zip(pages, texts))
+
+    _parse_status = staticmethod(_parse_status)
+
+    async def get_status(self):
+        return _parse_status(await self._get_status_pages())
+
+    async def reboot(self):
+        if not self.logged_in:
+            raise rout3r.RouterLoggedOutException("This object has been logged out")
+        rout3r.metrics.increment(rout3r.metrics.REBOOTS, self.model)
+        status, _ = await self._request("POST", "/apply.cgi", data={
+
+                "action_mode": "reboot",
+                "action_script": "",
+                "action_wait": 140
+
+        }, headers=_make_headers("apply.asp"))
+        self._pages.invalidate()
+        if status == 200:
+            self.logged_in = False
+            return True
+        return False
+
+    async def _force_logout(self):
+        rout3r.metrics.increment(rout3r.metrics.FORCED_LOGOUTS, self.model)
+        await self.logout()
+        raise rout3r.RouterLoggedOutException("This object is now logged out")
+
+    async def logout(self):
+        if self.logged_in:
+            self.logged_in = False
+            try:
+                await self._get("/Logout.asp", headers=_make_headers("Logout.asp"))
+            except:
+                pass
+        await self._close_session()
 
 __routers__ = [RTAC68U]
+__async_routers__ = [AsyncRTAC68U]
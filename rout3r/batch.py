@@ -0,0 +1,210 @@
+"""Batch operations across many routers for rout3r
+
+A Batch logs in to each router of a list of RouterResults, runs one operation on it (a method name such as
+"get_firmware" or "reboot", or a function of the router object) and logs out, collecting a BatchResult per
+router. Operations run on a bounded worker pool with:
+
+    - a rate limit per subnet, so routers sharing an uplink are not all contacted at once
+    - rolling waves per site (the subnet by default): at most max_fraction of a site's routers are being
+      operated on, or settling afterwards, at any time
+    - round-robin dispatch across sites, so no site waits behind another
+
+    batch = rout3r.batch.Batch(routers, ("admin", "password"), max_fraction=0.25, settle=300)
+    for result in batch.run("reboot"):
+        print(result)"""
+__author__ = "ex0dus"
+__version__ = "1.0"
+
+import collections, ipaddress, logging, threading, time, concurrent.futures, rout3r.polling
+
+CONCURRENCY = 16
+"""How many routers are operated on at once"""
+SUBNET_PREFIX = 24
+"""The prefix length grouping router IPv4 addresses into subnets (IPv6 addresses use 64)"""
+
+log = logging.getLogger(__name__)
+
+class BatchResult:
+    """The outcome of an operation on one router: its return value, or the exception it raised"""
+    __slots__ = ("router", "value", "error", "elapsed")
+
+    def __init__(self, router, value=None, error=None, elapsed=0):
+        self.router = router
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ip_address(self):
+        return self.router.ip_address
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __str__(self):
+        return str({"ip_address": self.ip_address, "value": self.value, "error": self.error,
+                    "elapsed": round(self.elapsed, 3)})
+
+    def __repr__(self):
+        return str(self)
+
+class BatchSkipped(Exception):
+    """The error of routers left out after the batch reached max_failures"""
+    pass
+
+def subnet(ip_address, prefix=SUBNET_PREFIX):
+    """Return the subnet of a router address ("host" or "host:port") as a string, or the host if it is not an
+    IP address"""
+    host, _ = rout3r.polling._split_address(ip_address, 80)
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return host
+    return str(ipaddress.ip_network("{0}/{1}".format(host, prefix if address.version == 4 else 64), strict=False))
+
+class _Site:
+    __slots__ = ("pending", "active", "limit")
+
+    def __init__(self):
+        self.pending = collections.deque()
+        self.active = 0
+        self.limit = 1
+
+class Batch:
+    """An operation run across routers (RouterResults, or anything with a Class and ip_address)
+
+    credentials is a (username, password) tuple, or a function returning one for a router. rate is how many
+    routers per second may be started in each subnet (unlimited if None). site maps a router to the group
+    max_fraction applies to, by default its subnet. settle is how long a router keeps its site's slot after
+    the operation: a number of seconds, or a function called with the router object before it is logged out
+    (which should return once the router is ready again). Once max_failures routers have failed, the remaining
+    ones are skipped. on_result(result) is called from a worker thread as each router finishes"""
+
+    def __init__(self, routers, credentials, concurrency=CONCURRENCY, rate=None, subnet_prefix=SUBNET_PREFIX,
+                 max_fraction=1.0, site=None, settle=None, max_failures=None, on_result=None):
+        self.routers = list(routers)
+        self.credentials = credentials
+        self.concurrency = concurrency
+        self.rate = rate
+        self.subnet_prefix = subnet_prefix
+        self.max_fraction = max_fraction
+        self.site = site or (lambda router: subnet(router.ip_address, self.subnet_prefix))
+        self.settle = settle
+        self.max_failures = max_failures
+        self.on_result = on_result
+
+    def _login(self, router):
+        username, password = self.credentials(router) if callable(self.credentials) else self.credentials
+        return router.Class(username, password, ip_address=router.ip_address)
+
+    def _operate(self, router, operation, args, kwargs):
+        start = time.monotonic()
+        instance = None
+        try:
+            instance = self._login(router)
+            if callable(operation):
+                value = operation(instance, *args, **kwargs)
+            else:
+                value = getattr(instance, operation)(*args, **kwargs)
+            result = BatchResult(router, value, elapsed=time.monotonic() - start)
+        except Exception as e:
+            log.warning("{0} failed on {1}: {2}".format(getattr(operation, "__name__", operation),
+                                                        router.ip_address, e))
+            result = BatchResult(router, error=e, elapsed=time.monotonic() - start)
+        try:
+            # Settle before logging out, so a settle function logging back in (wait_until_ready) is logged out too
+            if self.settle is not None and result.ok:
+                if callable(self.settle):
+                    try:
+                        self.settle(instance)
+                    except Exception as e:
+                        log.warning("{0} did not settle: {1}".format(router.ip_address, e))
+                else:
+                    time.sleep(self.settle)
+        finally:
+            if instance is not None:
+                try:
+                    instance.logout()
+                except Exception:
+                    pass
+        if self.on_result is not None:
+            self.on_result(result)
+        return result
+
+    def run(self, operation, *args, **kwargs):
+        """Run the operation on every router and return their BatchResults, in the order of the routers"""
+        sites = collections.OrderedDict()
+        for index, router in enumerate(self.routers):
+            sites.setdefault(self.site(router), _Site()).pending.append(index)
+        for site in sites.values():
+            site.limit = max(1, int(len(site.pending) * self.max_fraction))
+        results = [None] * len(self.routers)
+        next_start = {}
+        condition = threading.Condition()
+        state = {"running": 0, "failures": 0}
+
+        def finish(site, index, future):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = BatchResult(self.routers[index], error=e)
+            with condition:
+                results[index] = result
+                site.active -= 1
+                state["running"] -= 1
+                if not results[index].ok:
+                    state["failures"] += 1
+                condition.notify()
+
+        def dispatch():
+            """Start the next router of the first site (in round-robin order) which may start one, returning
+            how long to wait if only the rate limit holds them back, or None"""
+            now = time.monotonic()
+            wait = None
+            for _ in range(len(sites)):
+                key, site = next(iter(sites.items()))
+                sites.move_to_end(key)
+                if not site.pending or site.active >= site.limit:
+                    continue
+                index = site.pending[0]
+                router_subnet = subnet(self.routers[index].ip_address, self.subnet_prefix)
+                ready = next_start.get(router_subnet, now)
+                if ready > now:
+                    wait = ready - now if wait is None else min(wait, ready - now)
+                    continue
+                site.pending.popleft()
+                site.active += 1
+                state["running"] += 1
+                if self.rate:
+                    next_start[router_subnet] = now + 1 / self.rate
+                future = executor.submit(self._operate, self.routers[index], operation, args, kwargs)
+                future.add_done_callback(lambda future, site=site, index=index: finish(site, index, future))
+                return 0
+            return wait
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            with condition:
+                while True:
+                    if self.max_failures is not None and state["failures"] >= self.max_failures:
+                        for site in sites.values():
+                            while site.pending:
+                                index = site.pending.popleft()
+                                results[index] = BatchResult(self.routers[index], error=BatchSkipped(
+                                    "Skipped after {0} failures".format(state["failures"])))
+                    if not any(site.pending for site in sites.values()):
+                        break
+                    wait = dispatch() if state["running"] < self.concurrency else None
+                    if wait != 0:
+                        condition.wait(wait)
+                while state["running"]:
+                    condition.wait()
+        return results
+
+def run(routers, credentials, operation, *args, **kwargs):
+    """Run an operation on every router with the default Batch settings (see Batch)"""
+    return Batch(routers, credentials).run(operation, *args, **kwargs)
+
+def failed(results):
+    """Return the results of the routers the operation failed on"""
+    return [result for result in results if not result.ok]
@@ -0,0 +1,124 @@
+"""Persistent discovery cache for rout3r
+
+Discovered routers are remembered on disk by gateway IP together with a fingerprint of the gateway (its MAC
+address from the ARP table, or the HTTP Server header when the MAC is unknown). A cached router is confirmed
+with a single request to the gateway, whose page must still carry the router's signature, and full discovery
+only runs again when the fingerprint changes or the entry expires. Gateways without either are not cached."""
+__author__ = "ex0dus"
+__version__ = "1.0"
+
+from requests.exceptions import ConnectionError, Timeout
+import json, os, time, importlib, tempfile, requests, rout3r
+
+CACHE_PATH = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                          "rout3r", "discovery.json")
+CACHE_TTL = 7 * 24 * 60 * 60
+"""How long in seconds a discovered router is trusted before it must be discovered again"""
+
+def _arp_mac(ip, arp_table="/proc/net/arp"):
+    """Look up the MAC address of an IP address in the kernel ARP table, or None if it is unknown"""
+    try:
+        with open(arp_table) as table:
+            next(table)
+            for line in table:
+                fields = line.split()
+                if len(fields) >= 4 and fields[0] == ip and fields[3] != "00:00:00:00:00:00":
+                    return fields[3].lower()
+    except (OSError, StopIteration):
+        pass
+    return None
+
+def fingerprint(ip, headers):
+    """Identify the device at the gateway IP address, preferring its MAC address over the response headers.
+    Returns None when neither is known"""
+    mac = _arp_mac(ip)
+    if mac is not None:
+        return "mac:" + mac
+    server = (headers or {}).get("Server")
+    return "server:" + server if server else None
+
+def _matches(Class, ip, result):
+    """Check the gateway page against the cached router class: its root and header markers, or check_model for
+    classes without a signature"""
+    if Class.signature is not None:
+        return Class.signature.match_root(result.text, result.headers)
+    return Class.check_model(result.text, ip)
+
+class DiscoveryCache:
+    """A small JSON file mapping gateway IP addresses to the router class found there"""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+
+    def _load(self):
+        try:
+            with open(self.path) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entries):
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(handle, "w") as temp_file:
+                json.dump(entries, temp_file)
+            os.replace(temp_path, self.path)
+        except:
+            os.unlink(temp_path)
+            raise
+
+    def get(self, ip):
+        """Return the unexpired cache entry for the IP address, or None"""
+        entry = self._load().get(ip)
+        if entry is None or time.time() - entry["time"] > self.ttl:
+            return None
+        return entry
+
+    def put(self, router):
+        """Remember a RouterResult returned by discovery, unless the gateway has no fingerprint"""
+        device = fingerprint(router.ip_address, router.headers)
+        if device is None:
+            return
+        entries = self._load()
+        entries[router.ip_address] = {
+
+            "module": router.Class.__module__,
+            "class": router.Class.__name__,
+            "fingerprint": device,
+            "time": time.time()
+
+        }
+        self._save(entries)
+
+    def invalidate(self, ip=None):
+        """Forget the entry for an IP address, or every entry if no IP address is given"""
+        entries = self._load()
+        if ip is None:
+            entries.clear()
+        else:
+            entries.pop(ip, None)
+        self._save(entries)
+
+    def revalidate(self, ip, timeout=rout3r.DISCOVERY_TIMEOUT):
+        """Confirm the cached router at the IP address with a single request and return a RouterResult, or
+        None if there is no entry or the gateway no longer matches it"""
+        entry = self.get(ip)
+        if entry is None:
+            return None
+        try:
+            result = requests.get("http://{0}/".format(ip), timeout=timeout)
+        except (ConnectionError, Timeout):
+            return None
+        device = fingerprint(ip, result.headers)
+        if device is None or device != entry["fingerprint"]:
+            return None
+        try:
+            Class = getattr(importlib.import_module(entry["module"]), entry["class"])
+        except (ImportError, AttributeError):
+            return None
+        if not _matches(Class, ip, result):
+            return None
+        return rout3r.RouterResult(Class, ip, result.headers)
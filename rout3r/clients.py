@@ -0,0 +1,248 @@
+"""Columnar client tables for rout3r
+
+A ClientTable stores the clients of a router in typed arrays (IPv4 addresses and MAC addresses as integers,
+radio strength, connection type and online flag) instead of one object per client, which keeps long client
+histories small. Router classes return one from get_clients(as_table=True).
+
+A ClientFeed turns successive client lists of a router into joined, left and changed ClientEvents, which is what
+Router.watch_clients yields. It hashes each raw client list response and does not parse one which is identical
+to the last."""
+__author__ = "ex0dus"
+__version__ = "1.0"
+
+import array, enum, hashlib, socket, rout3r
+
+class ConnectionType(enum.IntEnum):
+    """The connection types reported by router modules"""
+    UNKNOWN = 0
+    ETHERNET = 1
+    WIRED = 2
+    WIFI = 3
+    WIFI_2_4GHZ = 4
+    WIFI_5GHZ = 5
+    WIFI_5GHZ_2 = 6
+
+CONNECTION_TYPE_NAMES = ("unknown", "ethernet", "wired", "wifi", "wifi 2.4GHz", "wifi 5GHz/5GHz-1", "wifi 5Ghz-2")
+"""The connection_type strings of RouterClient, indexed by ConnectionType"""
+_CONNECTION_TYPE_CODES = {name: code for code, name in enumerate(CONNECTION_TYPE_NAMES)}
+
+NO_RADIO_STRENGTH = -128
+"""Stored in the radio strength column for clients without one"""
+
+WATCH_INTERVAL = 10
+"""Seconds between client list polls of Router.watch_clients"""
+
+JOINED = "joined"
+LEFT = "left"
+CHANGED = "changed"
+
+def mac_to_int(mac_address):
+    """Convert a MAC address string to a 48-bit integer, 0 if there is none"""
+    if not mac_address:
+        return 0
+    return int(mac_address.replace(":", "").replace("-", ""), 16)
+
+def int_to_mac(value):
+    """Convert a 48-bit integer to a lowercase MAC address string, None for 0"""
+    if not value:
+        return None
+    digits = "{0:012x}".format(value)
+    return ":".join(digits[i:i + 2] for i in range(0, 12, 2))
+
+def ip_to_int(ip_address):
+    """Convert an IPv4 address string to an integer, 0 if there is none"""
+    if not ip_address:
+        return 0
+    try:
+        return int.from_bytes(socket.inet_aton(ip_address), "big")
+    except OSError:
+        return 0
+
+def int_to_ip(value):
+    """Convert an integer to an IPv4 address string, None for 0"""
+    if not value:
+        return None
+    return socket.inet_ntoa(value.to_bytes(4, "big"))
+
+class ClientDiff:
+    """The clients which joined, left or changed between two client tables"""
+    __slots__ = ("joined", "left", "changed")
+
+    def __init__(self, joined, left, changed):
+        self.joined = joined
+        self.left = left
+        self.changed = changed
+
+    def __bool__(self):
+        return bool(self.joined or self.left or self.changed)
+
+    def __str__(self):
+        return str({"joined": self.joined, "left": self.left, "changed": self.changed})
+
+    def __repr__(self):
+        return str(self)
+
+class ClientTable:
+    """Router clients stored column by column, keyed by MAC address"""
+
+    def __init__(self):
+        self.names = []
+        self.ip_addresses = array.array("I")
+        self.mac_addresses = array.array("Q")
+        self.radio_strengths = array.array("b")
+        self.connection_types = array.array("B")
+        self.online = array.array("B")
+        self._index = None
+
+    @staticmethod
+    def from_clients(clients):
+        """Build a table from RouterClient objects"""
+        table = ClientTable()
+        for client in clients:
+            table.append(client.name, client.ip_address, client.mac_address, client.connection_type,
+                         client.radio_strength, client.is_online)
+        return table
+
+    def append(self, name, ip_address, mac_address, connection_type=None, radio_strength=None, is_online=True):
+        """Add a client from its RouterClient values"""
+        self.names.append(name)
+        self.ip_addresses.append(ip_to_int(ip_address))
+        self.mac_addresses.append(mac_to_int(mac_address))
+        self.radio_strengths.append(NO_RADIO_STRENGTH if radio_strength is None
+                                    else max(NO_RADIO_STRENGTH + 1, min(127, radio_strength)))
+        self.connection_types.append(_CONNECTION_TYPE_CODES.get(connection_type, ConnectionType.UNKNOWN))
+        self.online.append(1 if is_online else 0)
+        self._index = None
+
+    def _append_row(self, table, row):
+        table.names.append(self.names[row])
+        table.ip_addresses.append(self.ip_addresses[row])
+        table.mac_addresses.append(self.mac_addresses[row])
+        table.radio_strengths.append(self.radio_strengths[row])
+        table.connection_types.append(self.connection_types[row])
+        table.online.append(self.online[row])
+
+    def __len__(self):
+        return len(self.mac_addresses)
+
+    def __getitem__(self, row):
+        radio_strength = self.radio_strengths[row]
+        return rout3r.RouterClient(
+
+            name=self.names[row],
+            ip_address=int_to_ip(self.ip_addresses[row]),
+            mac_address=int_to_mac(self.mac_addresses[row]),
+            connection_type=CONNECTION_TYPE_NAMES[self.connection_types[row]],
+            radio_strength=None if radio_strength == NO_RADIO_STRENGTH else radio_strength,
+            is_online=bool(self.online[row])
+
+        )
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def __str__(self):
+        return str(list(self))
+
+    def __repr__(self):
+        return str(self)
+
+    def index(self, mac_address):
+        """Return the row of a client by MAC address (string or integer), or None"""
+        if self._index is None:
+            self._index = {mac: row for row, mac in enumerate(self.mac_addresses)}
+        if not isinstance(mac_address, int):
+            mac_address = mac_to_int(mac_address)
+        return self._index.get(mac_address)
+
+    def __contains__(self, mac_address):
+        return self.index(mac_address) is not None
+
+    def filter(self, predicate=None, is_online=None, connection_type=None):
+        """Return a new table of the clients matching every given condition. The predicate is called with the
+        table and a row number"""
+        if connection_type is not None and not isinstance(connection_type, int):
+            connection_type = _CONNECTION_TYPE_CODES.get(connection_type, ConnectionType.UNKNOWN)
+        table = ClientTable()
+        for row in range(len(self)):
+            if is_online is not None and bool(self.online[row]) != is_online:
+                continue
+            if connection_type is not None and self.connection_types[row] != connection_type:
+                continue
+            if predicate is not None and not predicate(self, row):
+                continue
+            self._append_row(table, row)
+        return table
+
+    def _row_changed(self, row, other, other_row):
+        return (self.ip_addresses[row] != other.ip_addresses[other_row]
+                or self.radio_strengths[row] != other.radio_strengths[other_row]
+                or self.connection_types[row] != other.connection_types[other_row]
+                or self.online[row] != other.online[other_row])
+
+    def diff(self, previous):
+        """Compare this table with an earlier one, returning a ClientDiff of tables of the clients which joined,
+        left, and changed IP address, radio strength, connection type or online state (with their new values)"""
+        diff = ClientDiff(ClientTable(), ClientTable(), ClientTable())
+        for row, mac in enumerate(self.mac_addresses):
+            previous_row = previous.index(mac)
+            if previous_row is None:
+                self._append_row(diff.joined, row)
+            elif self._row_changed(row, previous, previous_row):
+                self._append_row(diff.changed, row)
+        for previous_row, mac in enumerate(previous.mac_addresses):
+            if self.index(mac) is None:
+                previous._append_row(diff.left, previous_row)
+        return diff
+
+class ClientEvent:
+    """A client which joined, left or changed (kind is JOINED, LEFT or CHANGED). client is a RouterClient with the
+    current values (the last known ones for LEFT), previous holds the earlier values of a changed client"""
+    __slots__ = ("kind", "client", "previous")
+
+    def __init__(self, kind, client, previous=None):
+        self.kind = kind
+        self.client = client
+        self.previous = previous
+
+    def __str__(self):
+        return str({"kind": self.kind, "client": self.client, "previous": self.previous})
+
+    def __repr__(self):
+        return str(self)
+
+class ClientFeed:
+    """The last client table of a router, keyed by MAC address, turning each new client list into ClientEvents
+
+    parse converts a raw client list response into a ClientTable. With initial, the clients of the first list
+    are reported as joined"""
+
+    def __init__(self, parse=None, initial=True):
+        self.parse = parse
+        self.initial = initial
+        self.table = None
+        self._digest = None
+
+    def update(self, data):
+        """Return the events since the last update from a raw client list response, without parsing it if it
+        is byte-identical to the last one"""
+        digest = hashlib.sha1(data).digest()
+        if digest == self._digest:
+            return []
+        events = self.update_table(self.parse(data))
+        self._digest = digest
+        return events
+
+    def update_table(self, table):
+        """Return the events since the last update from a parsed ClientTable"""
+        previous, self.table = self.table, table
+        self._digest = None
+        if previous is None:
+            return [ClientEvent(JOINED, client) for client in table] if self.initial else []
+        diff = table.diff(previous)
+        events = [ClientEvent(JOINED, client) for client in diff.joined]
+        events.extend(ClientEvent(LEFT, client) for client in diff.left)
+        for row, mac in enumerate(diff.changed.mac_addresses):
+            events.append(ClientEvent(CHANGED, diff.changed[row], previous[previous.index(mac)]))
+        return events
@@ -0,0 +1,177 @@
+"""Declarative router model signatures for rout3r
+
+Router classes describe themselves with a Signature made of markers (substrings or compiled regular
+expressions) found in the gateway root page, its response headers and a few secondary pages. A
+SignatureRegistry compiles the root markers of every registered model into a single pattern, so the root
+page is scanned once no matter how many models are known, and each secondary page is fetched at most once
+per gateway."""
+__author__ = "ex0dus"
+__version__ = "1.0"
+
+import re
+
+MAX_SECONDARY_PAGES = 3
+"""The most secondary pages a single signature may ask to fetch"""
+
+_FLAGS = ((re.ASCII, "a"), (re.IGNORECASE, "i"), (re.MULTILINE, "m"), (re.DOTALL, "s"), (re.VERBOSE, "x"))
+_GLOBAL_FLAGS = re.compile(r"^\(\?[aiLmsux]+\)")
+
+def _pattern(marker):
+    """Return the source of a marker, with the flags of a compiled marker inlined so that it keeps them inside
+    a combined pattern"""
+    if not hasattr(marker, "pattern"):
+        return re.escape(marker)
+    flags = "".join(letter for flag, letter in _FLAGS if marker.flags & flag)
+    if not flags:
+        return marker.pattern
+    return "(?{0}:{1})".format(flags, _GLOBAL_FLAGS.sub("", marker.pattern))
+
+def _compile(markers):
+    return re.compile("|".join(_pattern(marker) for marker in markers))
+
+def _marker_to_json(marker):
+    if hasattr(marker, "pattern"):
+        return {"regex": marker.pattern, "flags": marker.flags}
+    return marker
+
+def _marker_from_json(marker):
+    if isinstance(marker, dict):
+        return re.compile(marker["regex"], marker.get("flags", 0))
+    return marker
+
+def _lower_headers(headers):
+    return {name.lower(): value for name, value in (headers or {}).items()}
+
+class Signature:
+    """Markers identifying a router model. Any one of the root markers must occur in the root page, and for
+    every header and secondary page listed, any one of its markers must occur in it.
+
+    Markers are plain substrings or compiled regular expressions without named groups."""
+
+    def __init__(self, root=(), headers=None, pages=None):
+        self.root = tuple(root)
+        self.headers = {name.lower(): tuple(markers) for name, markers in (headers or {}).items()}
+        self.pages = {path: tuple(markers) for path, markers in (pages or {}).items()}
+        if len(self.pages) > MAX_SECONDARY_PAGES:
+            raise ValueError("A signature may not fetch more than {0} secondary pages".format(MAX_SECONDARY_PAGES))
+        self._compiled = None
+
+    def to_json(self):
+        """Return the markers as a JSON-serializable dict (see rout3r.manifest)"""
+        return {
+
+            "root": [_marker_to_json(marker) for marker in self.root],
+            "headers": {name: [_marker_to_json(marker) for marker in markers] for name, markers in self.headers.items()},
+            "pages": {path: [_marker_to_json(marker) for marker in markers] for path, markers in self.pages.items()}
+
+        }
+
+    @staticmethod
+    def from_json(data):
+        """Rebuild a signature from the dict returned by to_json"""
+        return Signature(
+
+            root=[_marker_from_json(marker) for marker in data.get("root", ())],
+            headers={name: [_marker_from_json(marker) for marker in markers]
+                     for name, markers in data.get("headers", {}).items()},
+            pages={path: [_marker_from_json(marker) for marker in markers]
+                   for path, markers in data.get("pages", {}).items()}
+
+        )
+
+    def _secondary(self):
+        if self._compiled is None:
+            self._compiled = (
+                {name: _compile(markers) for name, markers in self.headers.items()},
+                {path: _compile(markers) for path, markers in self.pages.items()}
+            )
+        return self._compiled
+
+    def _match_headers(self, headers):
+        headers = _lower_headers(headers)
+        for name, pattern in self._secondary()[0].items():
+            if not pattern.search(headers.get(name, "")):
+                return False
+        return True
+
+    def match_secondary(self, headers, fetch):
+        """Check the header and secondary page markers, calling fetch(path) for the text of each page"""
+        if not self._match_headers(headers):
+            return False
+        for path, pattern in self._secondary()[1].items():
+            if not pattern.search(fetch(path)):
+                return False
+        return True
+
+    def match_root(self, text, headers=None):
+        """Return True when the root page text and headers carry this signature, leaving out the secondary pages"""
+        if self.root and not _compile(self.root).search(text):
+            return False
+        return self._match_headers(headers)
+
+    def match(self, text, headers=None, fetch=None):
+        """Return True when the root page text (and headers and secondary pages) carry this signature"""
+        if self.root and not _compile(self.root).search(text):
+            return False
+        return self.match_secondary(headers, fetch)
+
+class SignatureRegistry:
+    """A collection of signatures matched together in a single pass over the root page"""
+
+    def __init__(self):
+        self._keys = []
+        self._signatures = []
+        self._root = None
+        self._owners = None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def register(self, key, signature):
+        """Add a signature, identified by key when it matches (keys are returned in registration order)"""
+        self._keys.append(key)
+        self._signatures.append(signature)
+        self._root = None
+
+    def _compile_root(self):
+        parts = []
+        markers = []
+        for index, signature in enumerate(self._signatures):
+            for marker in signature.root:
+                parts.append("(?P<m{0}>{1})".format(len(parts), _pattern(marker)))
+                markers.append((re.compile(_pattern(marker)), index))
+        self._owners = markers
+        self._root = re.compile("(?=" + "|".join(parts) + ")") if parts else False
+
+    def candidates(self, text):
+        """Return (key, signature) for each signature whose root markers occur in the text, in registration
+        order"""
+        if self._root is None:
+            self._compile_root()
+        matched = set()
+        if self._root:
+            for match in self._root.finditer(text):
+                # The alternation only records the first marker matching at this offset, so the markers after it
+                # are tried here too for signatures not matched yet
+                first = int(match.lastgroup[1:])
+                matched.add(self._owners[first][1])
+                for pattern, index in self._owners[first + 1:]:
+                    if index not in matched and pattern.match(text, match.start()):
+                        matched.add(index)
+        return [(self._keys[index], signature) for index, signature in enumerate(self._signatures)
+                if not signature.root or index in matched]
+
+    def identify(self, text, headers=None, fetch=None):
+        """Return the key of the first signature matching the root page, or None. fetch(path) is called at
+        most once per secondary page"""
+        pages = {}
+
+        def fetch_once(path):
+            if path not in pages:
+                pages[path] = fetch(path)
+            return pages[path]
+
+        for key, signature in self.candidates(text):
+            if signature.match_secondary(headers, fetch_once):
+                return key
+        return None
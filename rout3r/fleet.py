@@ -0,0 +1,254 @@
+"""Fleet supervisor for rout3r
+
+The supervisor watches many gateways from one process. Checks are kept in a priority queue ordered by due
+time (with jitter so they do not bunch up) and run on a bounded worker pool, so no router needs its own thread.
+Each gateway moves through a small state machine:
+
+    online -> suspect -> rebooting -> recovering -> online
+
+A gateway becomes suspect when it reports its WAN offline (or cannot be reached), is rebooted once it has
+failed enough checks in a row, is followed through its boot phases with a rout3r.polling.BootProbe until it
+accepts a login again, and is given time to reconnect its WAN before it is checked again.
+How often each gateway is checked follows a rout3r.polling.PollPolicy, and each check is a
+rout3r.polling.TieredCheck which only reads the router's status page when cheaper probes cannot tell."""
+__author__ = "ex0dus"
+__version__ = "1.0"
+
+import heapq, itertools, json, logging, random, threading, time, concurrent.futures, rout3r, rout3r.polling
+
+ONLINE = "online"
+SUSPECT = "suspect"
+REBOOTING = "rebooting"
+RECOVERING = "recovering"
+
+SUSPECT_CHECKS = 2
+"""How many failed checks in a row get a gateway rebooted"""
+REBOOT_TIMEOUT = 300
+"""Seconds a rebooting gateway may take to come back before it is treated as suspect again"""
+RECOVER_TIMEOUT = 30
+"""Seconds a gateway is given to reconnect its WAN after logging back in"""
+JITTER = 0.1
+"""The fraction of each interval added or removed at random"""
+WORKERS = 16
+
+log = logging.getLogger(__name__)
+
+class Gateway:
+    """A gateway watched by the supervisor. Without a router class, the model is discovered automatically"""
+
+    def __init__(self, ip_address, username, password, router_class=None, name=None):
+        self.ip_address = ip_address
+        self.username = username
+        self.password = password
+        self.router_class = router_class
+        self.name = name or ip_address
+
+    @staticmethod
+    def from_dict(config):
+        """Create a gateway from a dict with ip_address, username, password and optionally name and model
+        ("module.Class", e.g. "actiontec.C1000A")"""
+        router_class = None
+        if config.get("model"):
+            router_module, class_name = config["model"].rsplit(".", 1)
+            router_class = getattr(rout3r._import_router_module(router_module), class_name)
+        return Gateway(config["ip_address"], config["username"], config["password"], router_class, config.get("name"))
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return str(self)
+
+def load_config(path):
+    """Read a JSON list of gateway dicts (see Gateway.from_dict)"""
+    with open(path) as config_file:
+        return [Gateway.from_dict(config) for config in json.load(config_file)]
+
+class _Watch:
+    """The supervisor's state for one gateway"""
+    __slots__ = ("gateway", "state", "router", "failures", "streak", "checks", "since", "boot")
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+        self.state = ONLINE
+        self.router = None
+        self.failures = 0
+        self.streak = 0
+        self.checks = 0
+        self.since = time.monotonic()
+        self.boot = None
+
+class Supervisor:
+    """Watches a fleet of gateways and reboots those whose WAN stays offline
+
+    on_change(gateway, old_state, new_state) is called from a worker thread whenever a gateway changes state. With a
+    rout3r.sessions.SessionStore, routers reuse sessions saved by other processes instead of logging in again, and
+    with a rout3r.history.History, the result of every WAN check is recorded. With a rout3r.workers.ParsePool,
+    full checks read the router's whole status and parse it in a worker process (recording its clients in the
+    history), so parsing a large fleet is spread over every core"""
+
+    def __init__(self, gateways, workers=WORKERS, policy=None, check=None, suspect_checks=SUSPECT_CHECKS,
+                 reboot_timeout=REBOOT_TIMEOUT, recover_timeout=RECOVER_TIMEOUT, jitter=JITTER, on_change=None,
+                 session_store=None, history=None, parse_pool=None):
+        self.watches = [_Watch(gateway if isinstance(gateway, Gateway) else Gateway.from_dict(gateway))
+                        for gateway in gateways]
+        self.workers = workers
+        self.policy = policy or rout3r.polling.PollPolicy()
+        self.check = check or rout3r.polling.TieredCheck()
+        self.suspect_checks = suspect_checks
+        self.reboot_timeout = reboot_timeout
+        self.recover_timeout = recover_timeout
+        self.jitter = jitter
+        self.on_change = on_change
+        self.session_store = session_store
+        self.history = history
+        self.parse_pool = parse_pool
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def states(self):
+        """Return a dict of each gateway's current state"""
+        return {watch.gateway: watch.state for watch in self.watches}
+
+    def _schedule(self, watch, delay):
+        delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        with self._condition:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._sequence), watch))
+            self._condition.notify()
+
+    def _set_state(self, watch, state):
+        if watch.state != state:
+            old_state, watch.state = watch.state, state
+            watch.since = time.monotonic()
+            watch.streak = 0
+            log.info("{0} is now {1} (was {2})".format(watch.gateway, state, old_state))
+            if self.on_change is not None:
+                self.on_change(watch.gateway, old_state, state)
+
+    def _login(self, watch):
+        gateway = watch.gateway
+        if gateway.router_class is None:
+            gateway.router_class = rout3r.get_router(gateway.ip_address, False).Class
+        watch.router = gateway.router_class(gateway.username, gateway.password, ip_address=gateway.ip_address,
+                                            session_store=self.session_store)
+        return watch.router
+
+    def _full_check(self, watch):
+        router = watch.router
+        if router is None or not router.logged_in:
+            router = self._login(watch)
+        if self.parse_pool is None:
+            return router.is_online()
+        status = self.parse_pool.status(router)
+        if self.history is not None and status.clients is not None:
+            self.history.record_clients(watch.gateway.ip_address, status.clients)
+        return status.online
+
+    def _is_online(self, watch):
+        """Check the WAN of a gateway, logging in first if needed. Unreachable gateways count as offline"""
+        watch.checks += 1
+        try:
+            return self.check(watch.gateway.ip_address, lambda: self._full_check(watch), watch.checks - 1)
+        except Exception as e:
+            log.debug("{0} check failed: {1}".format(watch.gateway, e))
+            watch.router = None
+            return False
+
+    def _reboot(self, watch):
+        gateway = watch.gateway
+        try:
+            router = watch.router if watch.router is not None and watch.router.logged_in else self._login(watch)
+            router.reboot()
+        except Exception as e:
+            log.warning("{0} reboot failed: {1}".format(gateway, e))
+        watch.router = None
+        if self.session_store is not None:
+            self.session_store.delete(gateway.ip_address, gateway.username)
+        # The probe backs off between the policy's reboot intervals while each boot phase is incomplete
+        watch.boot = rout3r.polling.BootProbe(gateway.ip_address, login=lambda: self._login(watch), down_first=True,
+                                              interval=self.policy.reboot_interval,
+                                              max_interval=self.policy.reboot_max_interval, backoff=self.policy.backoff,
+                                              on_phase=lambda phase: log.debug("{0} boot phase: {1}".format(
+                                                  gateway, phase)))
+
+    def _step(self, watch):
+        """Run one check of a gateway, update its state and return the delay until its next check"""
+        now = time.monotonic()
+        watch.streak += 1
+        if watch.state == REBOOTING:
+            delay = watch.boot.step()
+            if not watch.boot.ready:
+                if now - watch.since > self.reboot_timeout:
+                    watch.boot = None
+                    self._set_state(watch, SUSPECT)
+                    return self.policy.failing(0)
+                return delay
+            watch.boot = None
+            self._set_state(watch, RECOVERING)
+            return self.policy.failing(watch.streak)
+        online = self._is_online(watch)
+        if self.history is not None:
+            self.history.record_status(watch.gateway.ip_address, online)
+        if online:
+            watch.failures = 0
+            self._set_state(watch, ONLINE)
+            return self.policy.stable(watch.streak)
+        if watch.state == RECOVERING:
+            if now - watch.since < self.recover_timeout:
+                return self.policy.failing(watch.streak)
+            self._set_state(watch, SUSPECT)
+        watch.failures += 1
+        if watch.failures < self.suspect_checks:
+            self._set_state(watch, SUSPECT)
+            return self.policy.failing(watch.streak)
+        watch.failures = 0
+        self._reboot(watch)
+        self._set_state(watch, REBOOTING)
+        return self.policy.rebooting(0)
+
+    def _run_check(self, watch):
+        try:
+            delay = self._step(watch)
+        except Exception:
+            log.exception("{0} check crashed".format(watch.gateway))
+            delay = self.policy.failing(0)
+        if self._running:
+            self._schedule(watch, delay)
+
+    def run(self):
+        """Watch the gateways until stop() is called"""
+        self._running = True
+        for watch in self.watches:
+            self._schedule(watch, random.uniform(0, self.policy.failure_interval))
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while True:
+                with self._condition:
+                    while self._running and (not self._queue or self._queue[0][0] > time.monotonic()):
+                        self._condition.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                    if not self._running:
+                        break
+                    _, _, watch = heapq.heappop(self._queue)
+                executor.submit(self._run_check, watch)
+        finally:
+            self._running = False
+            executor.shutdown(wait=True)
+            for watch in self.watches:
+                if watch.router is not None:
+                    watch.router.logout()
+
+    def start(self):
+        """Watch the gateways from a background thread"""
+        self._thread = threading.Thread(target=self.run, name="rout3r-fleet", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching, waiting for running checks to finish"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
@@ -0,0 +1,282 @@
+"""Status and client history for rout3r
+
+A History keeps router status samples and client sightings in a local SQLite database. Samples are buffered
+and written in batches, one transaction per batch. Client snapshots are not stored as they are: each client
+keeps one row per continuous presence (first and last seen), which is extended while it keeps appearing, so
+"when was this MAC last seen" is a single index lookup. maintain() downsamples old status samples into
+buckets and deletes history past the retention period. Reads go through a memory-mapped database file.
+
+    history = rout3r.history.History()
+    history.record_status(router.ip_address, router.get_status())
+    history.availability(router.ip_address, days=30)
+    history.last_seen("aa:bb:cc:dd:ee:ff")"""
+__author__ = "ex0dus"
+__version__ = "1.0"
+
+import datetime, os, sqlite3, threading, time, rout3r.clients
+
+HISTORY_PATH = os.path.join(os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share"),
+                            "rout3r", "history.sqlite")
+BATCH_SIZE = 500
+"""How many buffered rows trigger a write"""
+FLUSH_INTERVAL = 10
+"""The most seconds rows stay buffered before they are written"""
+PRESENCE_GAP = 15 * 60
+"""Seconds a client may go unseen before its next sighting starts a new presence"""
+RAW_RETENTION = 2 * 24 * 60 * 60
+"""Seconds status samples are kept as they were recorded before maintain() downsamples them"""
+BUCKET = 5 * 60
+"""The length in seconds of the buckets old status samples are downsampled into"""
+RETENTION = 365 * 24 * 60 * 60
+"""Seconds any history is kept"""
+MMAP_SIZE = 256 * 1024 * 1024
+"""How many bytes of the database file reads may memory-map"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS routers (
+    id INTEGER PRIMARY KEY,
+    ip_address TEXT NOT NULL UNIQUE,
+    model TEXT
+);
+CREATE TABLE IF NOT EXISTS status (
+    router INTEGER NOT NULL,
+    time INTEGER NOT NULL,
+    resolution INTEGER NOT NULL,
+    samples INTEGER NOT NULL,
+    online INTEGER,
+    uptime INTEGER,
+    clients INTEGER,
+    PRIMARY KEY (router, time, resolution)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS presence (
+    id INTEGER PRIMARY KEY,
+    router INTEGER NOT NULL,
+    mac INTEGER NOT NULL,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL,
+    ip_address INTEGER,
+    name TEXT
+);
+CREATE INDEX IF NOT EXISTS presence_mac ON presence (mac, last_seen);
+CREATE INDEX IF NOT EXISTS presence_router ON presence (router, last_seen);
+"""
+
+def _seconds(value):
+    if isinstance(value, datetime.timedelta):
+        return int(value.total_seconds())
+    return int(value) if value is not None else None
+
+def _since(days, since):
+    if since is not None:
+        return int(since)
+    return int(time.time() - days * 24 * 60 * 60) if days is not None else 0
+
+class History:
+    """A status and client history database (see the module documentation). Safe to share between threads"""
+
+    def __init__(self, path=HISTORY_PATH, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 presence_gap=PRESENCE_GAP):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.presence_gap = presence_gap
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("PRAGMA mmap_size={0}".format(int(MMAP_SIZE)))
+        self._connection.executescript(_SCHEMA)
+        self._lock = threading.RLock()
+        self._routers = dict(self._connection.execute("SELECT ip_address, id FROM routers"))
+        self._status = []
+        self._sightings = {}
+        self._presence = {}
+        self._flushed = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _router(self, ip_address, model=None):
+        router = self._routers.get(ip_address)
+        if router is None:
+            with self._connection:
+                router = self._connection.execute("INSERT OR IGNORE INTO routers (ip_address, model) VALUES (?, ?)",
+                                                  (ip_address, model)).lastrowid
+                router = self._connection.execute("SELECT id FROM routers WHERE ip_address = ?",
+                                                  (ip_address,)).fetchone()[0]
+            self._routers[ip_address] = router
+        return router
+
+    def record_status(self, ip_address, status, at=None, model=None):
+        """Buffer a RouterStatus (or a bool for the WAN state alone) sampled at the unix time at (now by default).
+        The status clients, if any, are recorded with record_clients"""
+        at = int(at if at is not None else time.time())
+        if isinstance(status, bool):
+            status = rout3r.RouterStatus(online=status)
+        clients = status.clients
+        if clients is not None and not isinstance(clients, rout3r.clients.ClientTable):
+            clients = rout3r.clients.ClientTable.from_clients(clients)
+        with self._lock:
+            self._status.append((self._router(ip_address, model), at, 0, 1,
+                                 None if status.online is None else int(bool(status.online)),
+                                 _seconds(status.uptime), sum(clients.online) if clients is not None else None))
+            if clients is not None:
+                self.record_clients(ip_address, clients, at)
+            self._maybe_flush()
+
+    def record_clients(self, ip_address, clients, at=None):
+        """Buffer a client snapshot (RouterClient objects or a ClientTable) taken at the unix time at. Clients the
+        router lists as offline are not counted as present"""
+        at = int(at if at is not None else time.time())
+        if not isinstance(clients, rout3r.clients.ClientTable):
+            clients = rout3r.clients.ClientTable.from_clients(clients)
+        with self._lock:
+            router = self._router(ip_address)
+            for row, mac in enumerate(clients.mac_addresses):
+                if not mac or not clients.online[row]:
+                    continue
+                sighting = [at, at, clients.ip_addresses[row] or None, clients.names[row]]
+                intervals = self._sightings.get((router, mac))
+                if intervals is None:
+                    self._sightings[(router, mac)] = [sighting]
+                elif 0 <= at - intervals[-1][1] <= self.presence_gap:
+                    intervals[-1][1:] = sighting[1:]
+                else:
+                    intervals.append(sighting)
+            self._maybe_flush()
+
+    def _maybe_flush(self):
+        if (len(self._status) + len(self._sightings) >= self.batch_size
+                or time.monotonic() - self._flushed >= self.flush_interval):
+            self.flush()
+
+    def _open_presence(self, router, mac):
+        """Return (id, last_seen) of the latest presence of a client, caching it for the next sighting"""
+        key = (router, mac)
+        if key not in self._presence:
+            self._presence[key] = self._connection.execute(
+                "SELECT id, last_seen FROM presence WHERE router = ? AND mac = ? ORDER BY last_seen DESC LIMIT 1",
+                key).fetchone()
+        return self._presence[key]
+
+    def flush(self):
+        """Write every buffered sample in one transaction"""
+        with self._lock:
+            status, self._status = self._status, []
+            sightings, self._sightings = self._sightings, {}
+            self._flushed = time.monotonic()
+            if not status and not sightings:
+                return
+            with self._connection:
+                self._connection.execute("BEGIN")
+                self._connection.executemany("INSERT OR REPLACE INTO status VALUES (?, ?, ?, ?, ?, ?, ?)", status)
+                extended = []
+                for (router, mac), intervals in sightings.items():
+                    for first_seen, last_seen, ip_address, name in intervals:
+                        presence = self._open_presence(router, mac)
+                        if presence is not None and 0 <= first_seen - presence[1] <= self.presence_gap:
+                            extended.append((last_seen, ip_address, name, presence[0]))
+                            self._presence[(router, mac)] = (presence[0], last_seen)
+                        elif presence is None or first_seen > presence[1]:
+                            presence_id = self._connection.execute(
+                                "INSERT INTO presence (router, mac, first_seen, last_seen, ip_address, name) "
+                                "VALUES (?, ?, ?, ?, ?, ?)", (router, mac, first_seen, last_seen, ip_address,
+                                                              name)).lastrowid
+                            self._presence[(router, mac)] = (presence_id, last_seen)
+                self._connection.executemany("UPDATE presence SET last_seen = ?, ip_address = ?, name = ? WHERE id = ?",
+                                             extended)
+
+    def maintain(self, raw_retention=RAW_RETENTION, bucket=BUCKET, retention=RETENTION, now=None):
+        """Downsample status samples older than raw_retention into bucket second buckets, and delete history
+        older than retention"""
+        now = int(now if now is not None else time.time())
+        self.flush()
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            cutoff = now - raw_retention
+            self._connection.execute("""
+                INSERT INTO status
+                SELECT router, time / :bucket * :bucket, :bucket, SUM(samples), SUM(online), MAX(uptime),
+                       CAST(AVG(clients) AS INTEGER)
+                FROM status WHERE resolution = 0 AND time < :cutoff
+                GROUP BY router, time / :bucket
+                ON CONFLICT (router, time, resolution) DO UPDATE SET
+                    samples = samples + excluded.samples, online = online + excluded.online,
+                    uptime = MAX(uptime, excluded.uptime), clients = excluded.clients""",
+                                     {"bucket": bucket, "cutoff": cutoff - cutoff % bucket})
+            self._connection.execute("DELETE FROM status WHERE resolution = 0 AND time < ?", (cutoff - cutoff % bucket,))
+            self._connection.execute("DELETE FROM status WHERE time < ?", (now - retention,))
+            self._connection.execute("DELETE FROM presence WHERE last_seen < ?", (now - retention,))
+            self._presence.clear()
+
+    def _router_id(self, ip_address):
+        self.flush()
+        return self._routers.get(ip_address)
+
+    def status(self, ip_address, days=None, since=None, until=None):
+        """Return (time, online samples / samples, uptime in seconds, clients) rows of a router in a time range,
+        raw samples and downsampled buckets alike"""
+        router = self._router_id(ip_address)
+        if router is None:
+            return []
+        return [(at, online / samples if online is not None else None, uptime, clients)
+                for at, samples, online, uptime, clients in self._connection.execute(
+                    "SELECT time, samples, online, uptime, clients FROM status "
+                    "WHERE router = ? AND time >= ? AND time <= ? ORDER BY time",
+                    (router, _since(days, since), int(until if until is not None else time.time())))]
+
+    def availability(self, ip_address, days=None, since=None, until=None):
+        """Return the fraction of status samples of a router with its WAN online in a time range, or None"""
+        router = self._router_id(ip_address)
+        if router is None:
+            return None
+        online, samples = self._connection.execute(
+            "SELECT SUM(online), SUM(samples) FROM status "
+            "WHERE router = ? AND time >= ? AND time <= ? AND online IS NOT NULL",
+            (router, _since(days, since), int(until if until is not None else time.time()))).fetchone()
+        return online / samples if samples else None
+
+    def uptime(self, ip_address, days=None, since=None, until=None):
+        """Return (time, router uptime in seconds) of a router in a time range"""
+        return [(at, uptime) for at, _, uptime, _ in self.status(ip_address, days, since, until) if uptime is not None]
+
+    def last_seen(self, mac_address, ip_address=None):
+        """Return (router IP address, unix time, client IP address) of the last sighting of a MAC address, on
+        the given router or any, or None"""
+        self.flush()
+        query = ("SELECT routers.ip_address, last_seen, presence.ip_address FROM presence "
+                 "JOIN routers ON routers.id = presence.router WHERE mac = ?")
+        arguments = [rout3r.clients.mac_to_int(mac_address)]
+        if ip_address is not None:
+            query += " AND routers.ip_address = ?"
+            arguments.append(ip_address)
+        row = self._connection.execute(query + " ORDER BY last_seen DESC LIMIT 1", arguments).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], rout3r.clients.int_to_ip(row[2])
+
+    def presence(self, mac_address, days=None, since=None):
+        """Return (router IP address, first seen, last seen) of each presence of a MAC address in a time range"""
+        self.flush()
+        return self._connection.execute(
+            "SELECT routers.ip_address, first_seen, last_seen FROM presence "
+            "JOIN routers ON routers.id = presence.router WHERE mac = ? AND last_seen >= ? ORDER BY first_seen",
+            (rout3r.clients.mac_to_int(mac_address), _since(days, since))).fetchall()
+
+    def clients(self, ip_address, at=None):
+        """Return the MAC addresses of the clients present on a router at a unix time (now by default)"""
+        router = self._router_id(ip_address)
+        if router is None:
+            return []
+        at = int(at if at is not None else time.time())
+        return [rout3r.clients.int_to_mac(mac) for mac, in self._connection.execute(
+            "SELECT mac FROM presence WHERE router = ? AND last_seen >= ? AND first_seen <= ?",
+            (router, at - self.presence_gap, at))]
+
+    def close(self):
+        self.flush()
+        self._connection.close()
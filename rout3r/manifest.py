@@ -0,0 +1,39 @@
+"""Router module manifest generator for rout3r
+
+The manifest lists every router module with its router classes and their signatures, so that importing
+rout3r does not scan the package, and automatic discovery only imports the module of the router it finds.
+Regenerate it after adding or changing a router module:
+
+    python -m rout3r.manifest"""
+__author__ = "ex0dus"
+__version__ = "1.0"
+
+import json, importlib, rout3r
+
+def generate():
+    """Import every router module and return the manifest describing it"""
+    modules = {}
+    for router_module in rout3r._scan_modules():
+        _import = importlib.import_module("{pack}.{module}".format(
+            pack=rout3r.__package__,
+            module=router_module))
+        if not hasattr(_import, "__routers__"):
+            raise NotImplementedError("Module {0} is missing __routers__ list".format(_import))
+        modules[router_module] = {
+
+            router_class.__name__: router_class.signature.to_json() if router_class.signature is not None else None
+            for router_class in _import.__routers__
+
+        }
+    return {"version": 1, "modules": modules}
+
+def write(path=rout3r.MANIFEST_PATH):
+    """Generate the manifest and save it to the path"""
+    manifest = generate()
+    with open(path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+        manifest_file.write("\n")
+    return manifest
+
+if __name__ == "__main__":
+    write()
@@ -0,0 +1,181 @@
+"""Request and parse instrumentation for rout3r
+
+Once enabled, rout3r records how long each router request, login and parse step takes in a latency histogram
+per (router model, endpoint, phase), and counts retries, failed requests, forced logouts and reboots. The
+results can be exported in the Prometheus text format or received one by one through a callback. While
+disabled (the default), each hook costs a single global lookup."""
+__author__ = "ex0dus"
+__version__ = "1.0"
+
+import bisect, contextlib, functools, threading, time
+
+REQUEST = "request"
+LOGIN = "login"
+PARSE = "parse"
+
+RETRIES = "retries"
+ERRORS = "errors"
+FORCED_LOGOUTS = "forced_logouts"
+REBOOTS = "reboots"
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+"""The upper bounds in seconds of the latency histogram buckets"""
+PREFIX = "rout3r"
+"""The prefix of exported metric names"""
+
+class Histogram:
+    """Counts of observations per bucket, with their sum"""
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Return (upper bound, observations at or below it) pairs, ending with infinity"""
+        total = 0
+        result = []
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+class Metrics:
+    """Latency histograms keyed by (model, endpoint, phase) and counters keyed by (name, model)
+
+    callback(name, labels, value) is called for every observation ("seconds" with model, endpoint and phase
+    labels) and counter increment (the counter name with a model label), from the thread which recorded it"""
+
+    def __init__(self, buckets=BUCKETS, callback=None):
+        self.buckets = tuple(buckets)
+        self.callback = callback
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, model, endpoint, phase, seconds):
+        key = (model, endpoint, phase)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+        if self.callback is not None:
+            self.callback("seconds", {"model": model, "endpoint": endpoint, "phase": phase}, seconds)
+
+    def increment(self, name, model, value=1):
+        key = (name, model)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        if self.callback is not None:
+            self.callback(name, {"model": model}, value)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def to_prometheus(self):
+        """Return every histogram and counter in the Prometheus text exposition format"""
+        with self._lock:
+            histograms = sorted(self.histograms.items(), key=_sort_key)
+            counters = sorted(self.counters.items(), key=_sort_key)
+        lines = []
+        if histograms:
+            name = PREFIX + "_seconds"
+            lines.append("# HELP {0} Latency of router requests, logins and parse steps".format(name))
+            lines.append("# TYPE {0} histogram".format(name))
+            for (model, endpoint, phase), histogram in histograms:
+                labels = _labels(model=model, endpoint=endpoint, phase=phase)
+                for bound, count in histogram.cumulative():
+                    lines.append("{0}_bucket{{{1},le=\"{2}\"}} {3}".format(name, labels, _number(bound), count))
+                lines.append("{0}_sum{{{1}}} {2}".format(name, labels, repr(histogram.sum)))
+                lines.append("{0}_count{{{1}}} {2}".format(name, labels, histogram.count))
+        previous = None
+        for (counter, model), value in counters:
+            name = "{0}_{1}_total".format(PREFIX, counter)
+            if counter != previous:
+                lines.append("# TYPE {0} counter".format(name))
+                previous = counter
+            lines.append("{0}{{{1}}} {2}".format(name, _labels(model=model), value))
+        return "\n".join(lines) + "\n" if lines else ""
+
+def _sort_key(item):
+    return tuple(str(part) for part in item[0])
+
+def _number(value):
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+def _labels(**labels):
+    return ",".join("{0}=\"{1}\"".format(key, str(value if value is not None else "").replace("\\", "\\\\")
+                                         .replace("\"", "\\\"").replace("\n", "\\n"))
+                    for key, value in labels.items())
+
+_metrics = None
+
+def enable(metrics=None):
+    """Start recording into the given Metrics (or a new one) and return it"""
+    global _metrics
+    _metrics = metrics if metrics is not None else Metrics()
+    return _metrics
+
+def disable():
+    global _metrics
+    _metrics = None
+
+def get():
+    """Return the Metrics being recorded into, or None while disabled"""
+    return _metrics
+
+def enabled():
+    return _metrics is not None
+
+def observe(model, endpoint, phase, seconds):
+    metrics = _metrics
+    if metrics is not None:
+        metrics.observe(model, endpoint, phase, seconds)
+
+def increment(name, model, value=1):
+    metrics = _metrics
+    if metrics is not None:
+        metrics.increment(name, model, value)
+
+@contextlib.contextmanager
+def _timing(metrics, model, endpoint, phase):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe(model, endpoint, phase, time.perf_counter() - start)
+
+_NO_TIMING = contextlib.nullcontext()
+
+def timer(model, endpoint, phase):
+    """Return a context manager which records how long its block takes"""
+    metrics = _metrics
+    if metrics is None:
+        return _NO_TIMING
+    return _timing(metrics, model, endpoint, phase)
+
+def timed(model, endpoint, phase=PARSE):
+    """Decorator recording how long each call of the function takes"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            metrics = _metrics
+            if metrics is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                metrics.observe(model, endpoint, phase, time.perf_counter() - start)
+        return wrapper
+    return decorator
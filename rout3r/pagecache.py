@@ -0,0 +1,106 @@
+"""Per-router page cache for rout3r
+
+Router pages are kept for a short time so that several getters reading the same page cost a single request.
+Callers asking for a page which is already being fetched wait for that fetch instead of sending their own.
+Router classes invalidate the cache after changing settings."""
+__author__ = "ex0dus"
+__version__ = "1.0"
+
+import threading, time
+
+PAGE_TTL = 2.0
+"""How long in seconds a fetched page is reused, 0 disables caching (concurrent fetches are still shared)"""
+
+class _Pending:
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+class PageCache:
+    """A thread-safe cache of loaded pages with a time to live"""
+
+    def __init__(self, ttl=PAGE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._pages = {}
+        self._loading = {}
+        self._generation = 0
+
+    def get(self, key, load):
+        """Return the cached page for the key, or call load() to fetch it"""
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+            pending = self._loading.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._loading[key] = _Pending()
+                generation = self._generation
+        if not owner:
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+        try:
+            pending.value = load()
+            return pending.value
+        except BaseException as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._loading[key]
+                if pending.error is None and self.ttl > 0 and generation == self._generation:
+                    self._pages[key] = (time.monotonic() + self.ttl, pending.value)
+            pending.event.set()
+
+    def invalidate(self, key=None):
+        """Forget the page for the key, or every page if no key is given. Pages being fetched when this is
+        called are not cached"""
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._pages.clear()
+            else:
+                self._pages.pop(key, None)
+
+class AsyncPageCache:
+    """PageCache for asynchronous routers, loading pages with coroutines on a single event loop"""
+
+    def __init__(self, ttl=PAGE_TTL):
+        self.ttl = ttl
+        self._pages = {}
+        self._loading = {}
+        self._generation = 0
+
+    async def get(self, key, load):
+        """Return the cached page for the key, or await load() to fetch it"""
+        import asyncio
+        entry = self._pages.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        pending = self._loading.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        generation = self._generation
+        pending = self._loading[key] = asyncio.ensure_future(load())
+        try:
+            value = await asyncio.shield(pending)
+        finally:
+            if self._loading.get(key) is pending:
+                del self._loading[key]
+        if self.ttl > 0 and generation == self._generation:
+            self._pages[key] = (time.monotonic() + self.ttl, value)
+        return value
+
+    def invalidate(self, key=None):
+        """Forget the page for the key, or every page if no key is given. Pages being fetched when this is
+        called are not cached"""
+        self._generation += 1
+        if key is None:
+            self._pages.clear()
+        else:
+            self._pages.pop(key, None)
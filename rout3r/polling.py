@@ -0,0 +1,183 @@
+"""Adaptive polling for rout3r
+
+PollPolicy decides how long to wait before checking a router again: slowly while its link is stable, quickly
+after a failure, and with exponential backoff while it reboots. TieredCheck avoids the full status page scrape
+where it can, by first connecting to the router's web server and then optionally probing the WAN from this
+host. BootProbe follows a rebooting router through its boot phases so callers can use it the moment it is
+ready instead of sleeping for a fixed time."""
+__author__ = "ex0dus"
+__version__ = "1.0"
+
+import http.client, socket, time
+
+STABLE_INTERVAL = 30
+"""Seconds between checks of a router whose link has been up for a while"""
+FAILURE_INTERVAL = 3
+"""Seconds between checks of a router which has just failed a check"""
+REBOOT_INTERVAL = 5
+"""Seconds before the first check of a rebooting router"""
+REBOOT_MAX_INTERVAL = 60
+"""The most seconds between checks of a rebooting router (the BootProbe of rout3r.fleet backs off up to it)"""
+BACKOFF = 2
+"""The factor the interval grows by with each stable or rebooting check"""
+PROBE_TIMEOUT = 2
+"""Seconds a TCP probe may take to connect"""
+FULL_CHECK_EVERY = 10
+"""How many checks may be answered by the WAN probe before the router's own status is read again"""
+WAN_PROBE = ("1.1.1.1", 53)
+"""A well-known address to connect to when probing the WAN from a host behind the router"""
+READY_INTERVAL = 0.5
+"""Seconds before probing a booting router again after a phase completes"""
+READY_MAX_INTERVAL = 5
+"""The most seconds between probes of a booting router"""
+READY_TIMEOUT = 300
+"""Seconds Router.wait_until_ready waits for a router by default"""
+DOWN_TIMEOUT = 30
+"""Seconds to wait for a rebooted router to go down before assuming it already came back"""
+
+DOWN = "down"
+TCP = "tcp"
+HTTP = "http"
+LOGIN = "login"
+WAN = "wan"
+BOOT_PHASES = (DOWN, TCP, HTTP, LOGIN, WAN)
+"""The phases of a reboot in order, each named after what the router has reached"""
+
+class PollPolicy:
+    """Check intervals for each router state (see rout3r.fleet). streak is the number of checks in a row the
+    router has spent in its state"""
+
+    def __init__(self, stable_interval=STABLE_INTERVAL, failure_interval=FAILURE_INTERVAL,
+                 reboot_interval=REBOOT_INTERVAL, reboot_max_interval=REBOOT_MAX_INTERVAL, backoff=BACKOFF):
+        self.stable_interval = stable_interval
+        self.failure_interval = failure_interval
+        self.reboot_interval = reboot_interval
+        self.reboot_max_interval = reboot_max_interval
+        self.backoff = backoff
+
+    def stable(self, streak):
+        """Ramp up from the failure interval to the stable interval as the link stays up"""
+        return min(self.stable_interval, self.failure_interval * self.backoff ** streak)
+
+    def failing(self, streak):
+        return self.failure_interval
+
+    def rebooting(self, streak):
+        """Back off exponentially while the router reboots"""
+        return min(self.reboot_max_interval, self.reboot_interval * self.backoff ** streak)
+
+def _split_address(address, default_port):
+    if address.startswith("["):
+        host, _, port = address[1:].partition("]")
+        return host, int(port[1:]) if port.startswith(":") else default_port
+    if address.count(":") == 1:
+        host, port = address.split(":")
+        return host, int(port)
+    return address, default_port
+
+def tcp_probe(address, port=80, timeout=PROBE_TIMEOUT):
+    """Return True if a TCP connection can be made to the address ("host" or "host:port")"""
+    host, port = _split_address(address, port)
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+def http_probe(address, timeout=PROBE_TIMEOUT):
+    """Return True if the web server at the address ("host" or "host:port") answers without a server error"""
+    host, port = _split_address(address, 80)
+    connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        connection.request("GET", "/")
+        return connection.getresponse().status < 500
+    except (OSError, http.client.HTTPException):
+        return False
+    finally:
+        connection.close()
+
+class TieredCheck:
+    """Check a router's WAN with the cheapest probe that can answer:
+
+    1. a TCP connection to the router's web server, if it fails the router is down and offline
+    2. with a wan_probe (host, port), a TCP connection to it through the router, if it succeeds the WAN is up
+    3. otherwise the router's own status, through router.is_online()
+
+    Without a wan_probe every check reads the router's status. With one, the status is still read every
+    full_check_every checks."""
+
+    def __init__(self, wan_probe=None, full_check_every=FULL_CHECK_EVERY, timeout=PROBE_TIMEOUT):
+        self.wan_probe = wan_probe
+        self.full_check_every = full_check_every
+        self.timeout = timeout
+
+    def __call__(self, ip_address, is_online, count=0):
+        """Return whether the WAN is up, calling is_online() only if the cheaper probes cannot tell. count is
+        the number of checks made so far"""
+        if not tcp_probe(ip_address, timeout=self.timeout):
+            return False
+        if self.wan_probe is not None and count % self.full_check_every != 0:
+            if tcp_probe(self.wan_probe[0], self.wan_probe[1], self.timeout):
+                return True
+        return is_online()
+
+class BootProbe:
+    """Follows a router through the phases of a reboot: going down (with down_first), accepting TCP connections,
+    answering HTTP, accepting a login (login() should raise until it does) and, with wan, reporting its WAN
+    connected (is_online() returning True).
+
+    Each step() probes the current phase and moves on through every phase that is already complete, returning
+    how long to wait before the next step. The wait starts at interval and grows by backoff while a phase is
+    not complete, up to max_interval. on_phase(phase) is called as each phase is reached"""
+
+    def __init__(self, ip_address, login=None, is_online=None, wan=True, down_first=False, interval=READY_INTERVAL,
+                 max_interval=READY_MAX_INTERVAL, backoff=BACKOFF, timeout=PROBE_TIMEOUT, down_timeout=DOWN_TIMEOUT,
+                 on_phase=None):
+        self.ip_address = ip_address
+        self.login = login
+        self.is_online = is_online
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.down_timeout = down_timeout
+        self.on_phase = on_phase
+        self.phases = [phase for phase in BOOT_PHASES if (phase != DOWN or down_first)
+                       and (phase != LOGIN or login is not None) and (phase != WAN or (wan and is_online is not None))]
+        self.phase = None
+        self.attempts = 0
+        self.started = time.monotonic()
+
+    @property
+    def ready(self):
+        """Whether every phase is complete"""
+        return self.phase == self.phases[-1]
+
+    def _reached(self, phase):
+        if phase == DOWN:
+            return not tcp_probe(self.ip_address, timeout=self.timeout) or \
+                   time.monotonic() - self.started > self.down_timeout
+        if phase == TCP:
+            return tcp_probe(self.ip_address, timeout=self.timeout)
+        if phase == HTTP:
+            return http_probe(self.ip_address, self.timeout)
+        try:
+            if phase == LOGIN:
+                self.login()
+                return True
+            return bool(self.is_online())
+        except Exception:
+            return False
+
+    def step(self):
+        """Probe the router, returning the seconds to wait before the next step (0 once ready)"""
+        while not self.ready:
+            phase = self.phases[self.phases.index(self.phase) + 1 if self.phase is not None else 0]
+            if not self._reached(phase):
+                self.attempts += 1
+                return min(self.max_interval, self.interval * self.backoff ** (self.attempts - 1))
+            self.phase = phase
+            self.attempts = 0
+            if self.on_phase is not None:
+                self.on_phase(phase)
+        return 0
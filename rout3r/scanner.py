@@ -0,0 +1,269 @@
+"""Network-wide router scanner for rout3r
+
+Sweeps whole address ranges for routers: a fixed number of asyncio workers take addresses from the ranges in
+turn, connect to the web port and identify the router model from the gateway page with the same signatures
+(and check_model fallbacks) as rout3r.get_router. Open sockets never exceed the limit however large the ranges
+are, and results are produced as each host finishes, so an inventory can be written while the scan runs.
+
+    python -m rout3r.scanner 10.20.0.0/16 --limit 2000 --output inventory.jsonl
+
+Only the standard library is needed, gateway pages are fetched with a minimal HTTP/1.0 client."""
+__author__ = "ex0dus"
+__version__ = "1.0"
+
+import argparse, asyncio, ipaddress, json, queue, sys, threading, time, rout3r
+
+PORT = 80
+SCAN_LIMIT = 1000
+"""How many sockets a scan keeps open at once"""
+CONNECT_TIMEOUT = 1.5
+"""Seconds a host may take to accept a connection before it counts as closed"""
+READ_TIMEOUT = 5
+"""Seconds a page may take to arrive while identifying a router"""
+MAX_PAGE_SIZE = 256 * 1024
+"""The most bytes read of each page"""
+
+class ScanResult:
+    """A host with the port open. router_class is the identified router class, or None if no module
+    recognizes it (or identify was off, or the page could not be read, see error)"""
+    __slots__ = ("ip_address", "port", "router_class", "server", "error", "elapsed")
+
+    def __init__(self, ip_address, port, router_class=None, server=None, error=None, elapsed=0):
+        self.ip_address = ip_address
+        self.port = port
+        self.router_class = router_class
+        self.server = server
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def address(self):
+        """The address to give router classes: the IP address, with the port if it is not 80"""
+        if self.port == PORT:
+            return self.ip_address
+        host = "[{0}]".format(self.ip_address) if ":" in self.ip_address else self.ip_address
+        return "{0}:{1}".format(host, self.port)
+
+    def router(self):
+        """Return a RouterResult for an identified router, or None"""
+        if self.router_class is None:
+            return None
+        return rout3r.RouterResult(self.router_class, self.address, {"Server": self.server} if self.server else None)
+
+    def to_dict(self):
+        """Return an inventory entry"""
+        router_class = self.router_class
+        return {
+
+            "ip_address": self.ip_address,
+            "port": self.port,
+            "manufacturer": router_class.manufacturer if router_class is not None else None,
+            "model": router_class.model if router_class is not None else None,
+            "class": "{0}.{1}".format(router_class.__module__.rsplit(".", 1)[-1], router_class.__name__)
+                     if router_class is not None else None,
+            "server": self.server,
+            "error": (str(self.error) or type(self.error).__name__) if self.error is not None else None
+
+        }
+
+    def __str__(self):
+        return str(self.to_dict())
+
+    def __repr__(self):
+        return str(self)
+
+def _addresses(networks):
+    """Yield every host address of the networks (CIDR strings, single addresses or ipaddress networks)"""
+    for network in networks:
+        network = ipaddress.ip_network(network, strict=False)
+        if network.num_addresses == 1:
+            yield str(network.network_address)
+        else:
+            for address in network.hosts():
+                yield str(address)
+
+async def _fetch(ip_address, port, path, connect_timeout, read_timeout):
+    """GET a page over a new connection, returning (status, headers, text)"""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(ip_address, port), connect_timeout)
+    try:
+        host = "[{0}]".format(ip_address) if ":" in ip_address else ip_address
+        writer.write("GET {0} HTTP/1.0\r\nHost: {1}\r\nUser-Agent: rout3r/{2}\r\nConnection: close\r\n\r\n"
+                     .format(path, host, rout3r.__version__).encode("ascii"))
+        data = b""
+        deadline = time.monotonic() + read_timeout
+        while len(data) < MAX_PAGE_SIZE:
+            chunk = await asyncio.wait_for(reader.read(65536), max(0.01, deadline - time.monotonic()))
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        writer.close()
+    head, _, body = data.partition(b"\r\n\r\n")
+    lines = head.decode("iso-8859-1").split("\r\n")
+    status = int(lines[0].split()[1]) if len(lines[0].split()) > 1 else 0
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip()] = value.strip()
+    return status, headers, body.decode("utf-8", "replace")
+
+async def _identify(ip_address, port, connect_timeout, read_timeout):
+    """Return the router class of the host and the response headers of its gateway page"""
+    address = ip_address if port == PORT else "{0}:{1}".format(ip_address, port)
+    _, headers, text = await _fetch(ip_address, port, "/", connect_timeout, read_timeout)
+    registry, unsigned = rout3r._load_registry()
+    pages = {}
+    for key, signature in registry.candidates(text):
+        for path in signature.pages:
+            if path not in pages:
+                pages[path] = (await _fetch(ip_address, port, path, connect_timeout, read_timeout))[2]
+        if signature.match_secondary(headers, pages.__getitem__):
+            return rout3r._resolve_router(key), headers
+    loop = asyncio.get_running_loop()
+    for Class in unsigned:
+        if await loop.run_in_executor(None, Class.check_model, text, address):
+            return Class, headers
+    return None, headers
+
+async def _scan_host(ip_address, port, identify, connect_timeout, read_timeout):
+    start = time.monotonic()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip_address, port), connect_timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    writer.close()
+    result = ScanResult(ip_address, port)
+    if identify:
+        try:
+            result.router_class, headers = await _identify(ip_address, port, connect_timeout, read_timeout)
+            result.server = headers.get("Server")
+        except Exception as e:
+            result.error = e
+    result.elapsed = time.monotonic() - start
+    return result
+
+async def scan_async(networks, port=PORT, limit=SCAN_LIMIT, identify=True, connect_timeout=CONNECT_TIMEOUT,
+                     read_timeout=READ_TIMEOUT):
+    """Asynchronously yield a ScanResult for every host of the networks with the port open, as soon as each
+    is identified. At most limit hosts are being probed at once"""
+    addresses = _addresses(networks)
+    results = asyncio.Queue(maxsize=limit)
+    done = object()
+
+    async def worker():
+        for ip_address in addresses:
+            try:
+                result = await _scan_host(ip_address, port, identify, connect_timeout, read_timeout)
+            except Exception as e:
+                result = ScanResult(ip_address, port, error=e)
+            if result is not None:
+                await results.put(result)
+        await results.put(done)
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(limit)]
+    remaining = len(workers)
+    try:
+        while remaining:
+            result = await results.get()
+            if result is done:
+                remaining -= 1
+            else:
+                yield result
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+def scan(networks, port=PORT, limit=SCAN_LIMIT, identify=True, connect_timeout=CONNECT_TIMEOUT,
+         read_timeout=READ_TIMEOUT):
+    """Yield a ScanResult for every host of the networks with the port open (see scan_async). The scan runs on
+    an event loop in a background thread"""
+    results = queue.Queue(maxsize=limit)
+    done = object()
+    stop = threading.Event()
+    running = {}
+
+    async def produce():
+        running["loop"] = asyncio.get_running_loop()
+        running["task"] = asyncio.current_task()
+        if stop.is_set():
+            return
+        generator = scan_async(networks, port, limit, identify, connect_timeout, read_timeout)
+        try:
+            async for result in generator:
+                while True:
+                    try:
+                        results.put_nowait(result)
+                        break
+                    except queue.Full:
+                        await asyncio.sleep(0.05)
+        finally:
+            await generator.aclose()
+
+    def run():
+        try:
+            asyncio.run(produce())
+        except asyncio.CancelledError:
+            pass
+        except BaseException as e:
+            results.put(e)
+        results.put(done)
+
+    thread = threading.Thread(target=run, name="rout3r-scanner", daemon=True)
+    thread.start()
+    try:
+        while True:
+            result = results.get()
+            if result is done:
+                break
+            if isinstance(result, BaseException):
+                raise result
+            yield result
+    finally:
+        # Cancel the scan from this thread instead of waiting for it to produce another result
+        stop.set()
+        if "task" in running:
+            try:
+                running["loop"].call_soon_threadsafe(running["task"].cancel)
+            except RuntimeError:
+                pass
+        while thread.is_alive():
+            try:
+                results.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+def write_inventory(results, out, routers_only=False):
+    """Write each result to a file as a line of JSON, returning how many were written"""
+    count = 0
+    for result in results:
+        if routers_only and result.router_class is None:
+            continue
+        out.write(json.dumps(result.to_dict()) + "\n")
+        out.flush()
+        count += 1
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan address ranges for routers and write an inventory")
+    parser.add_argument("networks", nargs="+", help="CIDR ranges or addresses to scan")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--limit", type=int, default=SCAN_LIMIT, help="sockets open at once")
+    parser.add_argument("--connect-timeout", type=float, default=CONNECT_TIMEOUT)
+    parser.add_argument("--read-timeout", type=float, default=READ_TIMEOUT)
+    parser.add_argument("--no-identify", action="store_true", help="only report open ports")
+    parser.add_argument("--routers-only", action="store_true", help="leave out hosts no module recognizes")
+    parser.add_argument("--output", help="inventory file (JSON lines), standard output by default")
+    args = parser.parse_args()
+    out = open(args.output, "w") if args.output else sys.stdout
+    start = time.monotonic()
+    try:
+        count = write_inventory(scan(args.networks, args.port, args.limit, not args.no_identify, args.connect_timeout,
+                                     args.read_timeout), out, args.routers_only)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    sys.stderr.write("{0} hosts in {1:.1f}s\n".format(count, time.monotonic() - start))
+
+if __name__ == "__main__":
+    main()
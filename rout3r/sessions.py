@@ -0,0 +1,74 @@
+"""Shared router session store for rout3r
+
+Routers given a SessionStore save their session (cookies and session keys) after logging in, and reuse a saved
+session instead of logging in when they are created, so several processes watching the same router share one
+login. Logins are serialized between processes with a lock file, and a process whose session expired picks up
+a session another process has just saved instead of logging in again. Session files are only readable by the
+current user."""
+__author__ = "ex0dus"
+__version__ = "1.0"
+
+import contextlib, hashlib, json, os, tempfile, time
+
+SESSION_PATH = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or os.environ.get("XDG_CACHE_HOME")
+                            or os.path.expanduser("~/.cache"), "rout3r", "sessions")
+SESSION_TTL = 30 * 60
+"""How long in seconds a saved session is reused, routers usually expire idle sessions well before a day"""
+
+class SessionStore:
+    """A directory of saved router sessions, one file per (IP address, username)"""
+
+    def __init__(self, path=SESSION_PATH, ttl=SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+
+    def _file(self, ip_address, username, suffix=".json"):
+        key = hashlib.sha1("{0}\0{1}".format(ip_address, username).encode("utf-8")).hexdigest()
+        return os.path.join(self.path, key + suffix)
+
+    def load(self, ip_address, username):
+        """Return the saved session state for the router, or None"""
+        try:
+            with open(self._file(ip_address, username)) as session_file:
+                state = json.load(session_file)
+        except (OSError, ValueError):
+            return None
+        if time.time() - state.get("time", 0) > self.ttl:
+            return None
+        return state
+
+    def save(self, ip_address, username, state):
+        """Save the session state (a JSON-serializable dict) of the router"""
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        state = dict(state, time=time.time())
+        handle, temp_path = tempfile.mkstemp(dir=self.path)
+        try:
+            with os.fdopen(handle, "w") as temp_file:
+                json.dump(state, temp_file)
+            os.replace(temp_path, self._file(ip_address, username))
+        except:
+            os.unlink(temp_path)
+            raise
+
+    def delete(self, ip_address, username):
+        """Forget the saved session of the router"""
+        try:
+            os.unlink(self._file(ip_address, username))
+        except OSError:
+            pass
+
+    @contextlib.contextmanager
+    def lock(self, ip_address, username):
+        """Hold an exclusive lock on the router's session between processes while logging in"""
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        with open(self._file(ip_address, username, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,98 @@
+"""Shared HTTP transport for rout3r router modules
+
+Every router object gets its own session (and so its own cookies) from a Transport, while the connection
+pools, keep-alive connections, default timeouts and retry policy are shared by all of them. Custom requests
+adapters can be mounted on a Transport for particular URL prefixes. Sessions record each request's latency
+and retries in rout3r.metrics when it is enabled."""
+__author__ = "ex0dus"
+__version__ = "1.0"
+
+import time, urllib.parse, requests, rout3r.metrics
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = (3, 15)
+"""The (connect, read) timeout in seconds applied to requests which do not set their own"""
+DEFAULT_RETRIES = 2
+"""How many times an idempotent request is retried after a connection error or a 502/503/504 response"""
+DEFAULT_BACKOFF = 0.5
+"""The retry backoff factor, retries wait backoff * 2 ** (retry - 1) seconds"""
+POOL_CONNECTIONS = 64
+"""How many router hosts keep a connection pool"""
+POOL_MAXSIZE = 4
+"""How many keep-alive connections are kept per router host"""
+
+class Session(requests.Session):
+    """A requests session which applies the default timeout of its transport and leaves the shared connection
+    pools open when closed. Requests are recorded in rout3r.metrics under the session's router model"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, model=None):
+        super().__init__()
+        self.timeout = timeout
+        self.model = model
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        metrics = rout3r.metrics.get()
+        if metrics is None:
+            return super().request(method, url, **kwargs)
+        endpoint = urllib.parse.urlsplit(url).path
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, **kwargs)
+        except requests.RequestException:
+            metrics.increment(rout3r.metrics.ERRORS, self.model)
+            raise
+        finally:
+            metrics.observe(self.model, endpoint, rout3r.metrics.REQUEST, time.perf_counter() - start)
+        retries = getattr(response.raw, "retries", None)
+        if retries is not None and retries.history:
+            metrics.increment(rout3r.metrics.RETRIES, self.model, len(retries.history))
+        return response
+
+    def close(self):
+        self.cookies.clear()
+
+class Transport:
+    """Connection pools and request defaults shared by router sessions"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE):
+        self.timeout = timeout
+        self.adapters = {}
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff,
+                      status_forcelist=(502, 503, 504), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def mount(self, prefix, adapter):
+        """Use a requests adapter for every URL starting with the prefix, in sessions created afterwards"""
+        self.adapters[prefix] = adapter
+
+    def session(self, model=None):
+        """Create a session with its own cookies which shares this transport's connections, recording its
+        requests in rout3r.metrics under the router model"""
+        session = Session(self.timeout, model)
+        for prefix, adapter in self.adapters.items():
+            session.mount(prefix, adapter)
+        return session
+
+    def close(self):
+        """Close every pooled connection"""
+        for adapter in set(self.adapters.values()):
+            adapter.close()
+
+_default = None
+
+def get_default():
+    """Return the transport used by routers which are not given one"""
+    global _default
+    if _default is None:
+        _default = Transport()
+    return _default
+
+def set_default(transport):
+    """Replace the transport used by routers which are not given one"""
+    global _default
+    _default = transport
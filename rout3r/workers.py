@@ -0,0 +1,94 @@
+"""Multi-process status parsing for rout3r
+
+Parsing router pages (client list JSON, status XML, one object per client) holds the GIL, so a single process
+polling a large fleet is limited to one core however many threads fetch pages. A ParsePool keeps the network
+I/O in the calling process (a thread pool, or the event loop for asynchronous routers) and sends the raw pages
+to worker processes, which run the router module's _parse_status(pages, as_table=True) and send back a compact
+RouterStatus whose clients are a rout3r.clients.ClientTable. Vendor-specific client fields are not kept, and
+rout3r.metrics in the worker processes is not enabled.
+
+    with rout3r.workers.ParsePool() as pool:
+        for router, status in pool.map_status(routers):
+            ..."""
+__author__ = "ex0dus"
+__version__ = "1.0"
+
+import os, concurrent.futures, rout3r, rout3r.clients
+
+IO_WORKERS = 32
+"""How many routers map_status fetches pages from at once"""
+
+def _parse(parse_status, pages):
+    """Run in a worker process: parse the pages and return a compact status, its clients read straight into a
+    ClientTable"""
+    status = parse_status(pages, as_table=True)
+    if status.clients is not None and not isinstance(status.clients, rout3r.clients.ClientTable):
+        raise TypeError("{0} returned clients as a {1}, not a ClientTable".format(
+            parse_status.__qualname__, type(status.clients).__name__))
+    return status
+
+def _parser(router):
+    parse_status = type(router)._parse_status
+    if parse_status is None:
+        raise NotImplementedError("{0} does not parse its status pages separately".format(type(router).__name__))
+    return parse_status
+
+class ParsePool:
+    """A process pool parsing router status pages. processes defaults to the number of CPUs"""
+
+    def __init__(self, processes=None, io_workers=IO_WORKERS):
+        self.processes = processes or os.cpu_count() or 1
+        self.io_workers = io_workers
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.processes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, router):
+        """Fetch the status pages of a router in this thread and return a Future of its RouterStatus"""
+        if type(router)._parse_status is None:
+            future = concurrent.futures.Future()
+            future.set_result(router.get_status())
+            return future
+        return self._executor.submit(_parse, _parser(router), router._get_status_pages())
+
+    def status(self, router):
+        """Return the RouterStatus of a router, parsed in a worker process"""
+        return self.submit(router).result()
+
+    def map_status(self, routers):
+        """Yield (router, RouterStatus) for each router as soon as it is parsed, or (router, exception) if it
+        failed. Pages are fetched by io_workers threads while earlier pages are parsed"""
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.io_workers) as fetchers:
+            fetches = {fetchers.submit(self.submit, router): router for router in routers}
+            owners = dict(fetches)
+            pending = set(fetches)
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    router = owners.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        yield router, e
+                        continue
+                    if future in fetches:
+                        owners[result] = router
+                        pending.add(result)
+                    else:
+                        yield router, result
+
+    async def status_async(self, router):
+        """Return the RouterStatus of an asynchronous router, fetching its pages on the running event loop and
+        parsing them in a worker process"""
+        import asyncio
+        if type(router)._parse_status is None:
+            return await router.get_status()
+        pages = await router._get_status_pages()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, _parse, _parser(router), pages)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -1,52 +1,44 @@
 """The automatic router rebooter for Python"""
 __author__ = "ex0dus"
-__version__ = "1.0"
+__version__ = "1.1"
 
-import logging, time, rout3r
+import logging, rout3r, rout3r.fleet, rout3r.polling
 
 logging.basicConfig(level = logging.INFO, format='[%(asctime)s: %(levelname)s] %(message)s')
 log = logging.getLogger()
-log.info("Routerboot {ver} starting up...".format(ver=__version__))
-Model = rout3r.get_router("192.168.0.1", False) # Use your router's gateway IP here
-log.info("Model: {0}".format(Model))
 
-def login():
-    return Router("username", "password") # Use your router gateway password here
+GATEWAY_IP = "192.168.0.1" # Use your router's gateway IP here
+USERNAME = "username"
+PASSWORD = "password" # Use your router gateway password here
+CONFIG = None
+"""Path to a JSON list of gateways (see rout3r.fleet.load_config) to watch instead of the gateway above"""
+
+def on_change(gateway, old_state, new_state):
+    if new_state == rout3r.fleet.ONLINE:
+        log.info("Network status changed - {0} is now online".format(gateway))
+    elif new_state == rout3r.fleet.SUSPECT and old_state == rout3r.fleet.ONLINE:
+        log.info("Network status changed - {0} is now offline".format(gateway))
+    elif new_state == rout3r.fleet.REBOOTING:
+        log.info("Requested reboot of {0}".format(gateway))
+    elif new_state == rout3r.fleet.RECOVERING:
+        log.info("Routerboot reconnected to {0}, waiting while internet reconnects".format(gateway))
 
 def run():
-    router = login()
-    online = router.is_online()
-    previous_online = online
-    log.info("Routerboot connected - {ssid} is {status}".format(
-        ssid=router.get_ssid(),
-        status="online" if online else "offline"))
+    log.info("Routerboot {ver} starting up...".format(ver=__version__))
+    if CONFIG is not None:
+        gateways = rout3r.fleet.load_config(CONFIG)
+    else:
+        Model = rout3r.get_router(GATEWAY_IP, False, use_cache=True)
+        log.info("Model: {0}".format(Model.Class.__name__))
+        gateways = [rout3r.fleet.Gateway(Model.ip_address, USERNAME, PASSWORD, Model.Class)]
+    # Routerboot runs behind the router, so the WAN can be probed directly instead of reading the status page
+    check = rout3r.polling.TieredCheck(wan_probe=rout3r.polling.WAN_PROBE)
+    supervisor = rout3r.fleet.Supervisor(gateways, check=check, on_change=on_change)
     try:
-        while True:
-            try:
-                if router is None or not router.logged_in:
-                    try:
-                        router = login()
-                        log.info("Routerboot reconnected, idling for 30 seconds while internet reconnects")
-                        time.sleep(30)
-                        log.info("Continuing to test connectivity")
-                    except Exception:
-                        pass
-                online = False if router is None else router.is_online()
-                if previous_online != online:
-                    log.info("Network status changed - You are now {status}".format(
-                        status="online" if online else "offline"))
-                if not online and router is not None:
-                    log.info("Requesting reboot, idling for 20 seconds")
-                    router.reboot()
-                    time.sleep(20)
-                previous_online = online
-            except Exception as e:
-                if router is not None:
-                    log.info("Routerboot disconnected and polling")
-                    router = None
-            time.sleep(3)
-            
+        supervisor.run()
     except KeyboardInterrupt:
         pass
     log.info("Routerboot shutting down")
-    router.logout()
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,93 @@
+"""Tests for the router model signatures of rout3r.fingerprint"""
+__author__ = "ex0dus"
+__version__ = "1.0"
+
+import re, unittest
+from rout3r.fingerprint import Signature, SignatureRegistry
+
+def _no_fetch(path):
+    raise AssertionError("{0} should not be fetched".format(path))
+
+class SignatureTest(unittest.TestCase):
+
+    def test_substring_markers(self):
+        signature = Signature(root=["Actiontec C1000A", "board_id='C1000A'"])
+        self.assertTrue(signature.match("<title>Actiontec C1000A</title>"))
+        self.assertTrue(signature.match("var board_id='C1000A';"))
+        self.assertFalse(signature.match("<title>Actiontec</title>"))
+
+    def test_substring_markers_are_literal(self):
+        self.assertFalse(Signature(root=["RT-AC.8U"]).match("RT-AC68U"))
+
+    def test_compiled_marker_keeps_its_flags(self):
+        signature = Signature(root=[re.compile("actiontec", re.IGNORECASE)])
+        self.assertTrue(signature.match("ACTIONTEC"))
+        self.assertTrue(signature.match_root("ACTIONTEC"))
+
+    def test_compiled_marker_with_global_flags(self):
+        self.assertTrue(Signature(root=[re.compile("(?i)actiontec")]).match("ACTIONTEC"))
+
+    def test_flags_survive_json(self):
+        signature = Signature.from_json(Signature(root=[re.compile("actiontec", re.IGNORECASE)]).to_json())
+        self.assertTrue(signature.match("ACTIONTEC"))
+
+    def test_headers_and_pages(self):
+        signature = Signature(root=["Main_Login.asp"], headers={"Server": ["httpd"]},
+                              pages={"/Main_Login.asp": ["RT-AC68U"]})
+        self.assertTrue(signature.match("Main_Login.asp", {"server": "httpd/2.0"}, lambda path: "RT-AC68U"))
+        self.assertFalse(signature.match("Main_Login.asp", {"Server": "nginx"}, _no_fetch))
+        self.assertFalse(signature.match("Main_Login.asp", {"Server": "httpd"}, lambda path: "RT-AX88U"))
+        self.assertTrue(signature.match_root("Main_Login.asp", {"Server": "httpd"}))
+
+    def test_too_many_pages(self):
+        with self.assertRaises(ValueError):
+            Signature(pages={"/{0}".format(index): ["x"] for index in range(4)})
+
+class SignatureRegistryTest(unittest.TestCase):
+
+    def test_candidates_in_registration_order(self):
+        registry = SignatureRegistry()
+        registry.register("B", Signature(root=["RT-AC68U"]))
+        registry.register("A", Signature(root=["ASUS"]))
+        registry.register("C", Signature(root=["C1000A"]))
+        self.assertEqual([key for key, _ in registry.candidates("ASUS RT-AC68U")], ["B", "A"])
+
+    def test_markers_at_the_same_offset(self):
+        registry = SignatureRegistry()
+        registry.register("A", Signature(root=["ASUS"], pages={"/model": ["RT-AC68U"]}))
+        registry.register("B", Signature(root=["ASUS RT-AX88U"]))
+        text = "<title>ASUS RT-AX88U</title>"
+        self.assertEqual([key for key, _ in registry.candidates(text)], ["A", "B"])
+        self.assertEqual(registry.identify(text, fetch=lambda path: ""), "B")
+
+    def test_compiled_marker_flags(self):
+        registry = SignatureRegistry()
+        registry.register("A", Signature(root=[re.compile("actiontec", re.IGNORECASE)]))
+        registry.register("B", Signature(root=["actiontec"]))
+        self.assertEqual(registry.identify("ACTIONTEC"), "A")
+
+    def test_signature_without_root_markers(self):
+        registry = SignatureRegistry()
+        registry.register("A", Signature(root=["C1000A"]))
+        registry.register("B", Signature(headers={"Server": ["httpd"]}))
+        self.assertEqual(registry.identify("nothing", {"Server": "httpd"}), "B")
+        self.assertIsNone(registry.identify("nothing", {"Server": "nginx"}))
+
+    def test_pages_fetched_once(self):
+        fetched = []
+
+        def fetch(path):
+            fetched.append(path)
+            return ""
+
+        registry = SignatureRegistry()
+        registry.register("A", Signature(root=["ASUS"], pages={"/model": ["RT-AC68U"]}))
+        registry.register("B", Signature(root=["ASUS"], pages={"/model": ["RT-AX88U"]}))
+        self.assertIsNone(registry.identify("ASUS", fetch=fetch))
+        self.assertEqual(fetched, ["/model"])
+
+    def test_empty_registry(self):
+        self.assertIsNone(SignatureRegistry().identify("ASUS"))
+
+if __name__ == "__main__":
+    unittest.main()